@@ -6,28 +6,107 @@
 #
 # Description: Core Execution of the forward-facing gui
 # =============================================================================
-import copy
 import socket
 import json
 import time
 import traceback
 import os
-import machineid
 import subprocess
+import tarfile
 import sys
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from queue import Queue
+from typing import BinaryIO
 from tqdm import tqdm
 from threading import Thread, Event
 from json import JSONDecodeError
 
-from SWARMRDS.core.validator import activate_license
+from SWARMRDS.core.validator import activate_license, get_machine_fingerprint
 from SWARMRDS.utilities.file_utils import find_file_path, find_folder_path
 
 # from utils.constants import ENCODING_SCHEME
 ENCODING_SCHEME = "utf-8"
+# Header packets are small, so read them a little at a time, and use large
+# reads for message bodies and downloads to keep the number of system
+# calls down
 BUFFER_SIZE = 4096 * 2
+DOWNLOAD_BUFFER_SIZE = 256 * 1024
 MAX_PACKET_SIZE = 2048 * 2
+# Large enough to keep the TCP window open on fast links when
+# downloading multi-MB simulation data
+SOCKET_BUFFER_SIZE = 12 * 1024 * 1024
+# How long to block on the socket before checking whether the User has
+# asked to shut down
+SHUTDOWN_POLL_TIMEOUT = 0.5
+# How long, in seconds, a downloaded map or data set is reused before it
+# is fetched from the server again
+CACHE_TTL = 24 * 60 * 60
+# The most connections to open at once when downloading several levels.
+# Levels are downloaded over a single connection unless a caller asks
+# for more
+MAX_LEVEL_CONNECTIONS = 1
+# The most User code files to read at once
+MAX_FILE_READERS = 8
+# Refresh the download progress bar at most once per this many bytes
+PROGRESS_UPDATE_BYTES = 4 * 1024 * 1024
+
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    # Match orjson's compact output rather than padding every field
+    # with spaces
+    _JSON_SEPARATORS = (",", ":")
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=_JSON_SEPARATORS).encode(ENCODING_SCHEME)
+    _json_loads = json.loads
+
+# Only available on Linux
+TCP_QUICKACK = getattr(socket, "TCP_QUICKACK", None)
+# The header packet sent ahead of every message, filled in with the
+# message id and the number of bytes in the message
+HEADER_PACKET_TEMPLATE = b'{"ID":%d,"Type":"Singular","Body":{"Bytes":%d}}'
+
+# License files that have already been read, keyed by path, so that
+# creating several clients doesn't re-read the same file
+_LICENSE_CACHE = dict()
+
+
+@lru_cache(maxsize=8)
+def _load_supported_modules(file_path: str) -> dict:
+    """
+    Load the list of supported software modules. This is checked for
+    every module of every agent, so only read it once.
+
+    ### Inputs:
+    - file_path [str] The path to SupportedSoftwareModules.json
+
+    ### Outputs:
+    - The supported modules. Callers must not modify the result
+    """
+    with open(file_path, "r") as file:
+        return json.load(file)["SupportedModules"]
+
+
+def _read_user_code(file_name: str) -> str:
+    """
+    Read one of the User's code files and encode it to be sent.
+
+    ### Inputs:
+    - file_name [str] The path to the Python file
+
+    ### Outputs:
+    - The encoded code
+    """
+    # Read the raw bytes and decode them once, which skips the text
+    # layer's newline handling
+    with open(file_name, "rb") as file:
+        code = file.read().decode(ENCODING_SCHEME)
+    return _json_dumps(code).decode(ENCODING_SCHEME)
 
 
 class SWARMClient(Thread):
@@ -39,9 +118,23 @@ class SWARMClient(Thread):
     - port [int] The port on the machine to talk to
     - ip_address [str] the ip address to communicate with
     - debug [bool] A flag for debugging
+    - no_delay [bool] Whether to disable Nagle's algorithm, so that small
+                      packets are sent immediately
+    - socket_buffer_size [int] The requested size of the kernel send and
+                               receive buffers. Use 0 to leave the OS
+                               autotuning in place
+    - cache_ttl [float] How long, in seconds, cached downloads are reused
+                        instead of being fetched again. Use 0 to always
+                        download
+    - cache_maps [bool] Whether to reuse downloaded level schematics.
+                        Off by default, since a level may be updated on
+                        the server under the same name
+    - cache_data [bool] Whether to reuse extracted simulation data.
+                        Off by default, since a simulation may be re-run
+                        under the same name
     """
 
-    def __init__(self, ip_address: str = "127.0.0.1", port: int = 5002, debug: bool = False, response_queue: Queue = None, user_file_path: str = None) -> None:
+    def __init__(self, ip_address: str = "127.0.0.1", port: int = 5002, debug: bool = False, response_queue: Queue = None, user_file_path: str = None, no_delay: bool = True, socket_buffer_size: int = SOCKET_BUFFER_SIZE, cache_ttl: float = CACHE_TTL, cache_maps: bool = False, cache_data: bool = False) -> None:
         super().__init__(daemon=True)
         if response_queue is not None:
             response_queue.put({"Command": "RunSimulation", "Message": "Connecting to {} on port {}".format(ip_address, port)})
@@ -49,10 +142,18 @@ class SWARMClient(Thread):
         self.port = port
         # TODO Find a way to make this a isolated variable
         self.connected = False
-        self.message_map = dict()
         self.message_id = 0
         self.shutdown_requested = Event()
         self.debug = debug
+        self.no_delay = no_delay
+        self.socket_buffer_size = socket_buffer_size
+        self.cache_ttl = cache_ttl
+        self.cache_maps = cache_maps
+        self.cache_data = cache_data
+        self._buffer_size_warned = False
+        # Bytes that have been read from the socket but not yet consumed
+        self._recv_buffer = bytearray()
+        self._json_decoder = json.JSONDecoder()
         self.license_key = ""
         self.license_activated = False
         self.encoding = "utf-8"
@@ -61,11 +162,19 @@ class SWARMClient(Thread):
         self._response_queue = response_queue
         # Save the last response provided
         self.last_response = dict()
-        self.machine_id = machineid.hashed_id('swarm-dev')
+        self.machine_id = get_machine_fingerprint()
         print("User File Path {}".format(user_file_path))
         self._file_path = user_file_path
         self.load_license_key()
         self.activate_user_license()
+        # The license key and machine id are the same for every message we
+        # send, so check the license and build everything around the id,
+        # type and body once. The braces are stripped so the fields can be
+        # placed in any body.
+        auth_bytes = _json_dumps({"LicenseKey": self.retrieve_license_key(),
+                                  "MachineID": self.machine_id})[1:-1].replace(b"%", b"%%")
+        self._message_template = b'{"ID":%d,"Type":%b,"Body":{%b,' + auth_bytes + b'}}'
+        self._empty_message_template = b'{"ID":%d,"Type":%b,"Body":{' + auth_bytes + b'}}'
 
     def start(self) -> None:
         """
@@ -90,8 +199,11 @@ class SWARMClient(Thread):
         else:
             file_path = find_file_path("LicenseKey.json", "settings")
         try:
-            with open(file_path, "r") as file:
-                license_key = json.load(file)
+            license_key = _LICENSE_CACHE.get(file_path)
+            if license_key is None:
+                with open(file_path, "rb") as file:
+                    license_key = _json_loads(file.read())
+                _LICENSE_CACHE[file_path] = license_key
             self.license_key = license_key["Key"]
             self.license_activated = license_key["Activated"]
             self.account_id = license_key["AccountID"]
@@ -124,11 +236,13 @@ class SWARMClient(Thread):
                     file_path = self._file_path + "/settings/LicenseKey.json"
                 else:
                     file_path = find_file_path("LicenseKey.json", "settings")
-                with open(file_path, "w") as file:
-                    json.dump(new_license_file, file)
+                with open(file_path, "wb") as file:
+                    file.write(_json_dumps(new_license_file))
+                _LICENSE_CACHE[file_path] = new_license_file
                 return validated
             else:
                 if msg == "license has already been activated on this machine":
+                    self.license_activated = True
                     return True
                 else:
                     raise AssertionError("Activation of license failed! Reason: {}".format(msg))
@@ -154,6 +268,26 @@ class SWARMClient(Thread):
         else:
             raise AssertionError("Error! License was not activated!")
 
+    def _encode_message(self, message_id: int, body: dict, message_type: str = "Singular") -> bytes:
+        """
+        Encode a message for the server, adding the license key and
+        machine id to the body. These never change during a session, so
+        they are encoded once and spliced into each message.
+
+        ### Inputs:
+        - message_id [int] The id of the message
+        - body [dict] The body of the message, without the license key
+        - message_type [str] The type of message being sent
+
+        ### Outputs:
+        - The encoded message
+        """
+        body_bytes = _json_dumps(body)
+        if len(body_bytes) == 2:
+            return self._empty_message_template % (message_id, _json_dumps(message_type))
+        # Use a view to drop the braces, so a large body isn't copied
+        return self._message_template % (message_id, _json_dumps(message_type), memoryview(body_bytes)[1:-1])
+
     def connect(self) -> bool:
         """
         Connect to the SWARM Server using a standard socket, which is 
@@ -165,9 +299,8 @@ class SWARMClient(Thread):
         ### Outputs
         """
         try:
-            self.socket = socket.socket()
-            self.socket.connect((self.address, self.port))
-            # self.socket.setblocking(False)
+            self.socket = self._open_socket()
+            self._recv_buffer = bytearray()
             self.connected = True
             return True
         except Exception as error:
@@ -177,13 +310,75 @@ class SWARMClient(Thread):
                 self._response_queue.put({"Command": "RunSimulation", "Message": "Connection to server failed!"})
             return False
 
-    def send_message(self, message: str) -> bool:
+    def _open_socket(self) -> socket.socket:
+        """
+        Open a new connection to the SWARM Server, with the socket options
+        used for all of our requests.
+
+        ### Inputs:
+        - None
+
+        ### Outputs:
+        - The connected socket
+        """
+        new_socket = socket.socket()
+        try:
+            if self.socket_buffer_size > 0:
+                # Must be set before connecting so the window scale is
+                # negotiated during the handshake
+                self._set_socket_buffer_sizes(new_socket, self.socket_buffer_size)
+            new_socket.connect((self.address, self.port))
+            if self.no_delay:
+                # Our requests are small header and body packets, so send
+                # them without waiting to coalesce them
+                new_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # We can wait on a quiet connection for a whole simulation, so
+            # keep it from being dropped as idle along the way
+            new_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            # Keep the socket blocking so reads and writes wait in the
+            # kernel rather than being polled for
+            new_socket.setblocking(True)
+        except Exception:
+            new_socket.close()
+            raise
+        return new_socket
+
+    def _set_socket_buffer_sizes(self, new_socket: socket.socket, size: int) -> None:
+        """
+        Request larger kernel send and receive buffers for the socket.
+        The OS may cap the value (e.g. `net.core.rmem_max` on Linux), so
+        read it back and warn the User when we did not get what we asked
+        for.
+
+        ### Inputs:
+        - new_socket [socket] The socket to set the buffer sizes of
+        - size [int] The requested buffer size in bytes
+
+        ### Outputs:
+        - None
+        """
+        warned = False
+        for option, name in ((socket.SO_RCVBUF, "SO_RCVBUF"),
+                             (socket.SO_SNDBUF, "SO_SNDBUF")):
+            try:
+                new_socket.setsockopt(socket.SOL_SOCKET, option, size)
+                actual = new_socket.getsockopt(socket.SOL_SOCKET, option)
+            except OSError as error:
+                print("WARNING Unable to set {}: {}".format(name, error))
+                continue
+            # Only warn once per client, since we reconnect for each request
+            if actual < size and not self._buffer_size_warned:
+                print("WARNING Requested {} of {} bytes but only received {} bytes. Raise the OS limit to improve download speeds.".format(name, size, actual))
+                warned = True
+        self._buffer_size_warned = self._buffer_size_warned or warned
+
+    def send_message(self, message: bytes) -> bool:
         """
         Send a message to the SWARM Server. This is a base method to
         build a set of procedural calls on.
 
         ### Inputs:
-        - message[str] the message to send
+        - message[bytes] the encoded message to send
 
         ### Outputs
         - A boolean on whether the message was sent successfully
@@ -192,19 +387,14 @@ class SWARMClient(Thread):
             if self.connected:
                 # Send a header packet containing the information about the
                 # message to come.
-                header_packet = dict(ID=self.message_id,
-                                     Type="Singular",
-                                     Body={
-                                         "Bytes": len(message)
-                                     })
+                header_packet = HEADER_PACKET_TEMPLATE % (self.message_id, len(message))
+                # The header and body are sent as separate writes. The
+                # protocol has no length prefix, so the server parses the
+                # header from its own read.
+                self.socket.sendall(header_packet)
                 print("DEBUG Sent header packet")
-                self.socket.send(
-                    json.dumps(header_packet).encode(ENCODING_SCHEME))
-                # Don't immediately step on the socket. Give it some room to
-                # breathe
-                time.sleep(0.05)
                 print("Sending message")
-                self.socket.send(message)
+                self.socket.sendall(message)
                 return True
             else:
                 raise ConnectionError("Client is no longer connected")
@@ -212,7 +402,38 @@ class SWARMClient(Thread):
             traceback.print_exc()
             print("Connection failed")
             return False
-        
+
+    def _send_request(self, body: dict, message_type: str = "Singular") -> bool:
+        """
+        Encode a request with the current message id and send it. This
+        is the common start of each of the send_* methods.
+
+        ### Inputs:
+        - body [dict] The body of the request
+        - message_type [str] The type of the message
+
+        ### Outputs:
+        - A boolean on whether the message was sent successfully
+        """
+        return self.send_message(self._encode_message(self.message_id, body, message_type))
+
+    def _complete_request(self, sent: bool) -> None:
+        """
+        Finish a request once its response has been handled.
+
+        ### Inputs:
+        - sent [bool] Whether the request was sent
+
+        ### Outputs:
+        - None
+        """
+        # Only increment to the next message id if we know the last message
+        # was sent.
+        if sent:
+            self.message_id += 1
+        # The server kills the connection after the call
+        self.connected = False
+
     def send_multipart_file(self, message_id: int, file_name: str) -> None:
         """
         Send a multipart file that has already been encoded in bytes.
@@ -224,70 +445,173 @@ class SWARMClient(Thread):
         - None
         """
         print("Sending multipart file to User")
-        start_message = {"ID": message_id,
-                         "Type": "Multipart",
-                         "Body": {
-            "Number Of Bytes": 0,
-            "Number Of Packets": 0,
-            "LicenseKey": self.retrieve_license_key(),
-            "MachineID": self.machine_id
-        }}
         if self._file_path is not None:
             file_name = self._file_path + "/" + file_name
         else:
             file_name = find_file_path(file_name, file_name.split("/")[-2])
-        with open(file_name, "rb") as file:
-            raw_bytes = file.read()
-
-        start_message["Body"]["Command"] = "Load Model"
+        file_size = os.path.getsize(file_name)
         # We need full paths for the file name to start:
         # Example: models/SSD.tar.gz but we only want the name of the tar
         # file to be sent. So, always take the last part of the file name
-        start_message["Body"]["FileName"] = file_name.split("/")[-1]
-
-        start_message["Body"]["PacketSize"] = MAX_PACKET_SIZE
-        start_message["Body"]["Number Of Packets"] = (
-            int(len(raw_bytes) / MAX_PACKET_SIZE)) + 1
-        start_message["Body"]["Number Of Bytes"] = len(raw_bytes)
-        chunks = [raw_bytes[(i * MAX_PACKET_SIZE):(i * MAX_PACKET_SIZE) + MAX_PACKET_SIZE]
-                  for i in range(int(len(raw_bytes) / MAX_PACKET_SIZE) + 1)]
-        # extra_bytes = int(start_message["Body"]["Number Of Packets"]/10) * 20 + int(start_message["Body"]["Number Of Packets"] % 10) * 1
-        # start_message["Body"]["Number Of Bytes"] += extra_bytes
-        encoded_message = json.dumps(start_message).encode(self.encoding)
-        
-        # Don't immediately step on the socket. Give it some room to
-        # breathe
-        time.sleep(0.1)
+        start_message = {"ID": message_id,
+                         "Type": "Multipart",
+                         "Body": {
+            "Number Of Bytes": file_size,
+            "Number Of Packets": (file_size + MAX_PACKET_SIZE - 1) // MAX_PACKET_SIZE,
+            "Command": "Load Model",
+            "FileName": file_name.split("/")[-1],
+            "PacketSize": MAX_PACKET_SIZE
+        }}
+        encoded_message = self._encode_message(message_id, start_message["Body"], start_message["Type"])
         self.send_message(encoded_message)
         print("DEBUG Sent header message")
+        # The protocol has no message boundaries and the server does not
+        # acknowledge the header, so give it time to read the header on
+        # its own before the file starts arriving. TCP_NODELAY only
+        # controls when we transmit, not how the server's reads split.
         time.sleep(0.5)
-        for i, chunk in enumerate(chunks):
-            try:
-                #print("DEBUG: Sending chunk {}".format(i))
-                # chunk = bytes("{}".format(i), encoding=self.encoding) + chunk
-                sent = self.socket.sendall(chunk)
-                # assert sent == MAX_PACKET_SIZE
-                # Sleep for 20 milliseconds on each message
-                # time.sleep(0.005)
-            except BlockingIOError:
-                chunk_not_sent = False
-                retries = 0
-                while not chunk_not_sent or (retries < 50):
-                    try:
-                        # Resource temp Unavailable
-                        # time.sleep(0.01)
-                        self.socket.send(chunk)
-                        chunk_not_sent = True
-                    except BlockingIOError:
-                        retries += 1
-                    except ConnectionResetError:
-                        break
-            except AssertionError:
-                print("Sent {} of {} bytes".format(sent, MAX_PACKET_SIZE))
-                self.socket.send(chunk[sent:])
+        # Let the kernel copy the file straight to the socket rather than
+        # reading it into memory and sending it a packet at a time
+        with open(file_name, "rb") as file:
+            self.socket.sendfile(file)
 
         return True
 
+    def _quick_ack(self) -> None:
+        """
+        Ask the kernel to acknowledge received data straight away rather
+        than delaying the ACK, so the server can keep sending. Linux
+        clears this after each read, so it is set again every time.
+
+        ### Inputs:
+        - None
+
+        ### Outputs:
+        - None
+        """
+        if TCP_QUICKACK is not None:
+            try:
+                self.socket.setsockopt(socket.IPPROTO_TCP, TCP_QUICKACK, 1)
+            except OSError:
+                pass
+
+    def _recv_into(self, view: memoryview) -> int:
+        """
+        Fill the start of the given view, using any buffered bytes before
+        reading from the socket.
+
+        ### Inputs:
+        - view [memoryview] The writable view to read into
+
+        ### Outputs:
+        - The number of bytes written, where 0 means the connection closed
+        """
+        if self._recv_buffer:
+            numb_bytes = min(len(view), len(self._recv_buffer))
+            view[:numb_bytes] = self._recv_buffer[:numb_bytes]
+            del self._recv_buffer[:numb_bytes]
+            return numb_bytes
+        numb_bytes = self.socket.recv_into(view)
+        self._quick_ack()
+        return numb_bytes
+
+    def _recv_exactly(self, numb_bytes: int) -> bytearray:
+        """
+        Read exactly the given number of bytes from the server.
+
+        ### Inputs:
+        - numb_bytes [int] The number of bytes to read
+
+        ### Outputs:
+        - The received bytes
+        """
+        data = bytearray(numb_bytes)
+        view = memoryview(data)
+        received = 0
+        while received < numb_bytes:
+            try:
+                numb_recv = self._recv_into(view[received:received + DOWNLOAD_BUFFER_SIZE])
+            except socket.timeout:
+                # The body has already started, so keep waiting for it
+                continue
+            if numb_recv == 0:
+                raise ConnectionError("Connection closed with {} of {} bytes received".format(received, numb_bytes))
+            received += numb_recv
+        return data
+
+    def _recv_json(self) -> dict:
+        """
+        Read a single JSON object, such as a header packet, from the
+        server. The server does not mark where the object ends, so keep
+        reading until it parses, and save anything after it for the next
+        read since the body may arrive in the same segment.
+
+        ### Inputs:
+        - None
+
+        ### Outputs:
+        - The decoded JSON object
+        """
+        # An object can only be complete once a closing brace has arrived,
+        # so only parse again when one does rather than re-decoding the
+        # whole buffer after every read
+        may_be_complete = True
+        while True:
+            if self._recv_buffer and not self._recv_buffer.startswith(b"{"):
+                # Skip anything left over from a message we did not
+                # fully read, up to the start of the next object
+                start = self._recv_buffer.find(b"{")
+                del self._recv_buffer[:start if start >= 0 else len(self._recv_buffer)]
+            if self._recv_buffer and may_be_complete and self._recv_buffer.endswith(b"}"):
+                # Usually the buffer holds exactly one object, such as a
+                # header sent on its own, which the faster parser can
+                # handle without working out where the object ends
+                try:
+                    message = _json_loads(self._recv_buffer)
+                    self._recv_buffer.clear()
+                    return message
+                except JSONDecodeError:
+                    pass
+            if self._recv_buffer and may_be_complete:
+                # Anything after the object may be raw bytes that are not
+                # valid text, which only affects what follows the object
+                last_brace = self._recv_buffer.rfind(b"}")
+                text = self._recv_buffer[:last_brace + 1].decode(ENCODING_SCHEME, errors="replace")
+                try:
+                    message, end = self._json_decoder.raw_decode(text)
+                    del self._recv_buffer[:len(text[:end].encode(ENCODING_SCHEME))]
+                    return message
+                except JSONDecodeError:
+                    # Only an incomplete object is recoverable by reading
+                    # more. Anything else would never parse, so drop it.
+                    if len(self._recv_buffer) >= DOWNLOAD_BUFFER_SIZE:
+                        self._recv_buffer = bytearray()
+                        raise
+            new_bytes = self.socket.recv(BUFFER_SIZE)
+            self._quick_ack()
+            if not new_bytes:
+                raise ConnectionError("Connection closed by the server")
+            self._recv_buffer.extend(new_bytes)
+            may_be_complete = b"}" in new_bytes
+
+    def _recv_message(self) -> dict:
+        """
+        Read the next message from the server. Messages are normally sent
+        as a header packet holding the size of the body, followed by the
+        body itself.
+
+        ### Inputs:
+        - None
+
+        ### Outputs:
+        - The decoded message
+        """
+        message = self._recv_json()
+        body = message.get("Body")
+        if isinstance(body, dict) and "Bytes" in body:
+            message = _json_loads(self._recv_exactly(body["Bytes"]))
+        return message
+
     def wait_for_response_packet(self, message_id: int, sim_name: str = None) -> dict:
         """
         Once we send a message, wait for the response from the server.
@@ -300,45 +624,27 @@ class SWARMClient(Thread):
         """
         response_completed = False
         received_message = None
-        received_header = False
-        received_bytes = b''
-        total_bytes = 0
         message = None
+        # Wake up periodically while waiting so that a shutdown request
+        # is noticed even when the server is quiet
+        self.socket.settimeout(SHUTDOWN_POLL_TIMEOUT if self._response_queue is not None else None)
         while not response_completed:
             try:
-                message = self.socket.recv(BUFFER_SIZE)
-                if received_header:
-                    received_bytes += message
-                    if len(received_bytes) < total_bytes:
-                        continue
-                    else:
-                        message = received_bytes
-
-                message = json.loads(message.decode(ENCODING_SCHEME))
+                message = self._recv_message()
                 # print(message)
-                if not received_header:
-                    is_header = "Bytes" in message["Body"].keys()
-                    if is_header:
-                        total_bytes = message["Body"]["Bytes"]
-                        received_header = True
-                        continue
-
-                if int(message["ID"]) == message_id:
+                if message["ID"] == message_id:
                     received_message = message["Body"]
                     response_completed = True
-                    self.message_map[str(message_id)]["Completed"] = True
                 else:
-                    received_header = False
-                    received_bytes = b''
-                    total_bytes = 0
-                    if "Status" in message['Body'].keys():
-                        print(message["Body"]["Status"])
+                    body = message["Body"]
+                    if "Status" in body:
+                        print(body["Status"])
                         if self._response_queue is not None:
-                            self._response_queue.put({"Command": "RunSimulation", "Message": message["Body"]["Status"]})
-                    if "ValidationResults" in message["Body"].keys():
+                            self._response_queue.put({"Command": "RunSimulation", "Message": body["Status"]})
+                    if "ValidationResults" in body:
                         print("User Code has been Validated")
                         response_msg = ""
-                        for agent, feedback in message["Body"]["ValidationResults"].items():
+                        for agent, feedback in body["ValidationResults"].items():
                             response_msg += "Code Feedback for {}\n".format(agent)
                             print("Code Feedback for {}".format(agent))
                             for module_name, statement in feedback.items():
@@ -348,33 +654,25 @@ class SWARMClient(Thread):
                                 print(statement)
                         if self._response_queue is not None:
                             self._response_queue.put({"Command": "RunSimulation", "Message": response_msg})
-                    if "Error" in message["Body"].keys():
-                        error = message["Body"]["Error"]
+                    if "Error" in body:
+                        error = body["Error"]
                         if error == "Critical":
                             print("ERROR! {}".format(error))
                             if self._response_queue is not None:
                                 self._response_queue.put({"Command": "RunSimulation", "Message": error})
                             assert AssertionError("Received a critical error!")
                     
-                if self._response_queue is not None:
-                    shutdown = self._check_response_queue()
-                    if shutdown:
-                        message_packet = dict(ID=self.message_id,
-                                  Type="Singular", Body=None)
-                        message_packet["Body"] = "Connection Ended"
-                        self.send_message(json.dumps(message_packet).encode(ENCODING_SCHEME))
-                        # Close the socket, which alerts the server
-                        # that we are shutting down.
-                        # self.socket.close()
-                        # response_completed = True
-                        received_message = {
-                                "Status": "Client ended simulation!",
-                                "Sim_name": sim_name
-                            }
-            except BlockingIOError:
-                # Ensure this thread does not cause the computer
-                # to take off!
-                time.sleep(0.001)
+                if self._end_connection_if_requested():
+                    received_message = {
+                            "Status": "Client ended simulation!",
+                            "Sim_name": sim_name
+                        }
+            except socket.timeout:
+                if self._end_connection_if_requested():
+                    received_message = {
+                            "Status": "Client ended simulation!",
+                            "Sim_name": sim_name
+                        }
             except AssertionError as error:
                 print("Critical Error occurred!")
                 print(error)
@@ -382,22 +680,43 @@ class SWARMClient(Thread):
             except OSError as error:
                 print(error)
                 break
-            except JSONDecodeError:
-                pass
-                # print("DEBUG JSON Decoding Error")
-                # if message is not None:
-                #     print(message.decode(ENCODING_SCHEME))
-                # self.socket.close()
-                # break
+            except JSONDecodeError as error:
+                # The message has been read in full, so the next one can
+                # still be read, but the User should know about it
+                print("Unable to decode message from the server: {}".format(error))
             except Exception:
                 if message is not None:
                     print(message)
                 traceback.print_exc()
+        self.socket.settimeout(None)
 
         if received_message == None:
             assert ValueError("We did not receive a message in the response")
         return received_message
 
+    def _end_connection_if_requested(self) -> bool:
+        """
+        Tell the server that we are ending the connection if the User
+        has asked to shut down.
+
+        ### Inputs:
+        - None
+
+        ### Outputs:
+        - Whether a shutdown was requested
+        """
+        if self._response_queue is None or not self._check_response_queue():
+            return False
+        message_packet = dict(ID=self.message_id,
+                              Type="Singular", Body=None)
+        message_packet["Body"] = "Connection Ended"
+        self.send_message(_json_dumps(message_packet))
+        # Close the socket, which alerts the server
+        # that we are shutting down.
+        # self.socket.close()
+        # response_completed = True
+        return True
+
     def _check_response_queue(self) -> None:
         """
         Check the response queue for a specific message related to
@@ -425,46 +744,45 @@ class SWARMClient(Thread):
         except Exception:
             return False
 
-    def wait_for_response_bytes(self, message_id: int) -> bytearray:
+    def wait_for_response_bytes(self, message_id: int, sink: BinaryIO = None) -> bytearray:
         """
         Once we send a message, wait for the response from the server.
 
         ### Inputs:
         - message_id [int] The id of the message that was sent
+        - sink [BinaryIO] An optional file to write the bytes to as they
+                          arrive, rather than holding them in memory
 
         ### Outputs:
-        - A raw byte string to be turned into another data type
+        - A raw byte string to be turned into another data type, or the
+          number of bytes written when a sink is given
         """
         response_completed = False
         received_bytes = b''
         message = None
         while not response_completed:
             try:
-                message = self.socket.recv(BUFFER_SIZE)
-                message = json.loads(message.decode(ENCODING_SCHEME))
+                message = self._recv_json()
                 if message["ID"] == message_id:
                     if message["Type"] == "Multipart":
-                        received_bytes = self.handle_multipart(message)
+                        received_bytes = self.handle_multipart(message, sink)
                     else:
                         if self._response_queue is not None:
                             self._response_queue.put({"Command": "RunSimulation", "Message": message["Body"]})
                         print(message["Body"])
                         # received_bytes = message["Body"]["Data"]
                     response_completed = True
-                    self.message_map[str(message_id)]["Completed"] = True
                 else:
                     assert ValueError("Unknown message id!")
-            except BlockingIOError:
-                pass
             except Exception:
                 traceback.print_exc()
                 if message is not None:
-                    print(message.decode(ENCODING_SCHEME))
+                    print(message)
                 return received_bytes
 
         return received_bytes
 
-    def handle_multipart(self, message: dict) -> bytes:
+    def handle_multipart(self, message: dict, sink: BinaryIO = None) -> bytearray:
         """
         Handle receipt of a multi-part message when transferring data.
         We define multi-part as the first message received and some
@@ -472,15 +790,25 @@ class SWARMClient(Thread):
 
         ### Inputs:
         - message [dict] the start message
+        - sink [BinaryIO] An optional file to write the bytes to as they
+                          arrive, so large downloads are not held in memory
 
         ### Outputs:
-        - received bytes
+        - received bytes, or the number of bytes written when a sink is
+          given
         """
         if self.debug:
             print("DEBUG: Handing Multipart Message")
         numb_packets = message["Body"]["Number Of Packets"]
         total_bytes = message["Body"]["Number Of Bytes"]
-        recv_bytes = list()
+        if sink is None:
+            # Receive straight into a single buffer rather than joining a
+            # list of chunks, which would hold two copies of the download
+            recv_data = bytearray(total_bytes)
+        else:
+            # Only one chunk is held at a time before it is written out
+            recv_data = bytearray(min(DOWNLOAD_BUFFER_SIZE, total_bytes))
+        recv_view = memoryview(recv_data)
         total_recv_bytes = 0
         print("Downloading {} bytes".format(total_bytes))
 
@@ -488,22 +816,38 @@ class SWARMClient(Thread):
             print(f"DEBUG: Packets to download {numb_packets}")
         
         with tqdm(unit="B", unit_scale=True, desc="Data Tarball", total=total_bytes) as bar:
+            pending_bytes = 0
             while total_recv_bytes < total_bytes:
                 try:
-                    new_bytes = self.socket.recv(BUFFER_SIZE)
-                    recv_bytes.append(new_bytes)
-                    total_recv_bytes += len(new_bytes)
-                    bar.update(len(new_bytes))
-
-                except BlockingIOError:
-                    pass
-                except Exception:
+                    # Never read past the end of this message
+                    if sink is None:
+                        numb_bytes = self._recv_into(
+                            recv_view[total_recv_bytes:total_recv_bytes + DOWNLOAD_BUFFER_SIZE])
+                    else:
+                        numb_bytes = self._recv_into(
+                            recv_view[:total_bytes - total_recv_bytes])
+                        sink.write(recv_view[:numb_bytes])
+                    if numb_bytes == 0:
+                        print("Connection closed with {} of {} bytes received".format(total_recv_bytes, total_bytes))
+                        break
+                    total_recv_bytes += numb_bytes
+                    # Updating the bar is not free, so batch the updates
+                    pending_bytes += numb_bytes
+                    if pending_bytes >= PROGRESS_UPDATE_BYTES:
+                        bar.update(pending_bytes)
+                        pending_bytes = 0
+
+                except OSError:
                     traceback.print_exc()
-
-        # Ensure we have received the full message
-        #  assert total_bytes == bytes_received
-
-        recv_data = b''.join(recv_bytes)
+                    break
+            bar.update(pending_bytes)
+
+        # The view must be released before the buffer can be resized
+        recv_view.release()
+        if sink is not None:
+            return total_recv_bytes
+        if total_recv_bytes < total_bytes:
+            del recv_data[total_recv_bytes:]
         return recv_data
 
     def _retrieve_loaded_models_from_server(self) -> list:
@@ -522,15 +866,9 @@ class SWARMClient(Thread):
         message = dict(ID=self.message_id,
                        Type="Singular",
                        Body={
-                                "Command": "Retrieve Loaded Models",
-                                "LicenseKey": self.retrieve_license_key(),
-                                "MachineID": self.machine_id
+                                "Command": "Retrieve Loaded Models"
                             })
-        self.message_map[str(self.message_id)] = {
-                "Completed": False,
-                "ID": str(self.message_id)
-            }
-        sent = self.send_message(json.dumps(message).encode(ENCODING_SCHEME))
+        sent = self.send_message(self._encode_message(message["ID"], message["Body"]))
         if sent:
             # We are waiting for a message that contains a Body with the following
             # information:
@@ -543,7 +881,6 @@ class SWARMClient(Thread):
             data = self.wait_for_response_packet(self.message_id)
 
             print("DEBUG Models message: {}".format(data))
-            self.message_map[str(self.message_id)]["Completed"] = True
             # Increment the next message ID
             if message["ID"] == self.message_id and len(data["Errors"]) == 0:
                 self.message_id += 1
@@ -573,19 +910,20 @@ class SWARMClient(Thread):
         user_code = dict()
         loaded_models = None
         cycle_connection = False
+        # The code entries to fill in, and the file each one is read from
+        code_files = list()
         for agent_name, agent_info in settings["Agents"].items():
             user_code[agent_name] = dict()
             for module_name, module in agent_info["SoftwareModules"].items():
                 # Determine that this module can load custom models, where we first
                 # check if the User has listed any models that will be used.
-                if "Parameters" in module.keys() and "Model" in module["Parameters"].keys() and self._query_custom_model_module_list(module_name):
+                if "Parameters" in module and "Model" in module["Parameters"] and self._query_custom_model_module_list(module_name):
                     if loaded_models is None:
                         self.connect()
                         loaded_models = self._retrieve_loaded_models_from_server()
                         # If we fail to retrieve the loaded models, then
                         # cancel the valdiation process
                         self.socket.close()
-                        time.sleep(1.0)
                         self.connected = False
                         if loaded_models is None:
                             return
@@ -594,13 +932,7 @@ class SWARMClient(Thread):
                         tar_file_name = self._generate_model_tar_file(module["Parameters"]["Model"])
                         self.connect()
                         sent = self.send_multipart_file(self.message_id, tar_file_name)
-                        
-                        time.sleep(1.0)
                         self.connected = False
-                        self.message_map[str(self.message_id)] = {
-                            "Completed": False,
-                            "ID": str(self.message_id)
-                        }
                         return_message = self.wait_for_response_packet(self.message_id)
                         self.socket.close()
                         if sent:
@@ -613,7 +945,7 @@ class SWARMClient(Thread):
                 else:
                     # If we don't have an algorithm for this module, we bypass
                     # this part of the system.
-                    if "Algorithm" not in module.keys():
+                    if "Algorithm" not in module:
                         continue
                     isCustomModule, isCustomAlgo = self.query_supported_module_list(module_name, module["Algorithm"]["ClassName"])
                     if self._file_path is not None:
@@ -621,12 +953,21 @@ class SWARMClient(Thread):
                     else:
                         file_path = find_folder_path("user_code")
                     if isCustomAlgo:
-                        
-                        with open("{}/{}/{}.py".format(file_path, agent_name,  module["Algorithm"]["ClassName"]), "r") as file:
-                            user_code[agent_name][module_name] = {"Code": json.dumps(file.read()), "Model": False, "AlgorithmName":  module["Algorithm"]["ClassName"]}
+                        code_file = "{}/{}/{}.py".format(file_path, agent_name,  module["Algorithm"]["ClassName"])
                     elif isCustomModule:
-                        with open("{}/{}/{}.py".format(file_path, agent_name, module_name), "r") as file:
-                            user_code[agent_name][module_name] = {"Code": json.dumps(file.read()), "Model": False, "AlgorithmName": module["Algorithm"]["ClassName"]}
+                        code_file = "{}/{}/{}.py".format(file_path, agent_name, module_name)
+                    else:
+                        continue
+                    user_code[agent_name][module_name] = {"Code": None, "Model": False, "AlgorithmName":  module["Algorithm"]["ClassName"]}
+                    code_files.append((user_code[agent_name][module_name], code_file))
+
+        # Read the files together, since each read is mostly spent waiting
+        # on the disk
+        if code_files:
+            with ThreadPoolExecutor(max_workers=min(len(code_files), MAX_FILE_READERS)) as executor:
+                codes = executor.map(_read_user_code, [code_file for _, code_file in code_files])
+                for (entry, _), code in zip(code_files, codes):
+                    entry["Code"] = code
 
         return user_code
 
@@ -640,12 +981,35 @@ class SWARMClient(Thread):
         ### Outputs:
         - The tar file name
         """
+        tar_file_name = "models/{}.tar.gz".format(model_name)
         if sys.platform.startswith('win32') or sys.platform.startswith('cygwin'):
             pass
-        else:
-            subprocess.run(["tar", "-czvf", "models/{}.tar.gz".format(model_name), "models/{}".format(model_name)])
+        elif not self._is_tar_file_current(tar_file_name, "models/{}".format(model_name)):
+            subprocess.run(["tar", "-czf", tar_file_name, "models/{}".format(model_name)])
         
-        return "models/{}.tar.gz".format(model_name)
+        return tar_file_name
+
+    def _is_tar_file_current(self, tar_file_name: str, folder: str) -> bool:
+        """
+        Check whether a Tarball is newer than everything in the folder it
+        was made from, so it can be sent again without rebuilding it.
+
+        ### Inputs:
+        - tar_file_name [str] The path of the Tarball
+        - folder [str] The folder the Tarball was made from
+
+        ### Outputs:
+        - Whether the Tarball can be reused
+        """
+        try:
+            tar_time = os.path.getmtime(tar_file_name)
+            for root, dirs, files in os.walk(folder):
+                for name in dirs + files:
+                    if os.path.getmtime(os.path.join(root, name)) >= tar_time:
+                        return False
+            return os.path.getmtime(folder) < tar_time
+        except OSError:
+            return False
 
     def _query_custom_model_module_list(self, module_name: str) -> bool:
         """
@@ -663,8 +1027,7 @@ class SWARMClient(Thread):
             file_path = self._file_path + "/SWARMRDS/core/SupportedSoftwareModules.json"
         else:
             file_path = find_file_path("SupportedSoftwareModules.json", "SWARMRDS/core")
-        with open(file_path, "r") as file:
-            supported_modules = json.load(file)["SupportedModules"]
+        supported_modules = _load_supported_modules(file_path)
 
         # If the User is defining a new module that we don't know the
         # name of.
@@ -688,8 +1051,7 @@ class SWARMClient(Thread):
             file_path = self._file_path + "/SWARMRDS/core/SupportedSoftwareModules.json"
         else:
             file_path = find_file_path("SupportedSoftwareModules.json", "SWARMRDS/core")
-        with open(file_path, "r") as file:
-            supported_modules = json.load(file)["SupportedModules"]
+        supported_modules = _load_supported_modules(file_path)
 
         # If the User is defining a new module that we don't know the
         # name of.
@@ -718,29 +1080,12 @@ class SWARMClient(Thread):
         - Confirmation that the message was sent.
         """
         try:
-            message_packet = dict(ID=self.message_id,
-                                  Type="Singular", Body=None)
-            json_file["LicenseKey"] = self.retrieve_license_key()
-            json_file["MachineID"] = self.machine_id
-            message_packet["Body"] = json_file
-
-            json_str = json.dumps(message_packet).encode(ENCODING_SCHEME)
-
-            self.message_map[str(self.message_id)] = {
-                "Completed": False,
-                "ID": str(self.message_id)
-            }
             print("DEBUG Sending execution message to server")
-            sent = self.send_message(json_str)
+            sent = self._send_request(json_file)
 
             completed = self.wait_for_response_packet(self.message_id, json_file["Sim_name"])
             assert completed
-            # Only increment to the next message id if we know the last message
-            # was sent.
-            if sent:
-                self.message_id += 1
-            # The server kills the connection after the call
-            self.connected = False
+            self._complete_request(sent)
             return completed
         except AssertionError:
             print("Simulation failed to be completed!")
@@ -749,85 +1094,150 @@ class SWARMClient(Thread):
             print(error)
             return False
 
-    def request_environment_schematics(self, supported_levels: list) -> bool:
+    def _is_cached(self, path: str) -> bool:
         """
-        Send a request to receive the environment schematics.
+        Check whether a file or folder we downloaded before is recent
+        enough to reuse.
 
         ### Inputs:
-        - json_file [str] the raw json file as a dict before sending
-        - simulation_id [int] The simulation id to be run
+        - path [str] The path to the downloaded file or folder
+
+        ### Outputs:
+        - Whether the download can be skipped
+        """
+        if self.cache_ttl <= 0:
+            return False
+        try:
+            return time.time() - os.path.getmtime(path) < self.cache_ttl
+        except OSError:
+            return False
+
+    def request_environment_schematics(self, supported_levels: list, max_connections: int = MAX_LEVEL_CONNECTIONS) -> bool:
+        """
+        Send a request to receive the environment schematics. When
+        several levels are requested and `max_connections` is more than
+        1, they are split across that many connections and downloaded
+        in parallel.
+
+        ### Inputs:
+        - supported_levels [list] The names of the levels to download
+        - max_connections [int] The most connections to open at once
 
         ### Outputs:
         - Confirmation taht the message was sent.
         """
         try:
-            message_packet = dict(ID=self.message_id, Type="Single", Body=None)
-            execution_package = dict(LicenseKey=self.retrieve_license_key(),
-                                     MachineID=self.machine_id,
-                                     levels=supported_levels)
-            message_packet["Body"] = execution_package
-            self.message_map[str(self.message_id)] = {
-                "Completed": False,
-                "ID": self.message_id
-            }
-            json_str = json.dumps(message_packet).encode(ENCODING_SCHEME)
-            sent = self.send_message(json_str)
-            for level in supported_levels:
-                # TODO We should wait for message receipt with a timeout.
-                raw_img_bytes = self.wait_for_response_bytes(self.message_id)
-                if raw_img_bytes:
-                    with open("maps/{}.png".format(level), "wb") as file:
-                        file.write(raw_img_bytes)
+            if self.cache_maps:
+                # Only ask for the levels we don't have a recent copy of
+                supported_levels = [level for level in supported_levels
+                                    if not self._is_cached("maps/{}.png".format(level))]
+                if not supported_levels:
+                    # Close the connection that was opened for this request
+                    self.socket.close()
+                    self.connected = False
+                    print("Levels were already downloaded! Please see the maps folder!")
+                    return True
+            os.makedirs("maps", exist_ok=True)
+            numb_connections = max(1, min(len(supported_levels), max_connections))
+            if numb_connections == 1:
+                sent = self._request_level_schematics(supported_levels, self.message_id)
+            else:
+                # The first set of levels uses the connection that is
+                # already open, and the others each get their own
+                level_sets = [supported_levels[i::numb_connections] for i in range(numb_connections)]
+                with ThreadPoolExecutor(max_workers=numb_connections) as executor:
+                    futures = [executor.submit(self._request_level_schematics, level_sets[0], self.message_id)]
+                    futures += [executor.submit(self._request_level_schematics, levels, self.message_id + i, True)
+                                for i, levels in enumerate(level_sets[1:], start=1)]
+                    sent = all([future.result() for future in futures])
             # Only increment to the next message id if we know the last message
             # was sent.
             if sent:
-                self.message_id += 1
+                self.message_id += numb_connections
             return True
         except Exception as error:
             print(error)
             return False
 
+    def _request_level_schematics(self, levels: list, message_id: int, new_connection: bool = False) -> bool:
+        """
+        Request a set of levels and save each schematic as it arrives.
+
+        ### Inputs:
+        - levels [list] The names of the levels to download
+        - message_id [int] The id to send the request with
+        - new_connection [bool] Whether to use a separate connection
+                                rather than the one that is open
+
+        ### Outputs:
+        - Whether the request was sent
+        """
+        connection = self
+        if new_connection:
+            try:
+                connection = _LevelConnection(self, message_id)
+            except OSError as error:
+                print(error)
+                return False
+        try:
+            json_str = connection._encode_message(message_id, dict(levels=levels), "Single")
+            sent = connection.send_message(json_str)
+            for level in levels:
+                # TODO We should wait for message receipt with a timeout.
+                raw_img_bytes = connection.wait_for_response_bytes(message_id)
+                if raw_img_bytes:
+                    with open("maps/{}.png".format(level), "wb") as file:
+                        file.write(raw_img_bytes)
+            return sent
+        finally:
+            if new_connection:
+                connection.socket.close()
+
     def send_data_extraction_message(self, message: dict) -> None:
         try:
-            message_packet = dict(ID=self.message_id, Type="Single", Body=None)
-            message["LicenseKey"] = self.retrieve_license_key()
-            message["MachineID"] = self.machine_id
-            message_packet["Body"] = message
-            self.message_map[str(self.message_id)] = {
-                "Completed": False,
-                "ID": self.message_id
-            }
-            json_str = json.dumps(message_packet).encode(ENCODING_SCHEME)
-            sent = self.send_message(json_str)
+            if self.cache_data:
+                if self._file_path is not None:
+                    data_path = self._file_path
+                else:
+                    data_path = os.getcwd()
+                if self._is_cached("{}/data/{}".format(data_path, message["SimName"])):
+                    # Close the connection that was opened for this request
+                    self.socket.close()
+                    self.connected = False
+                    print("Data for {} was already downloaded! Please see the Data folder!".format(message["SimName"]))
+                    return True
+            sent = self._send_request(message, "Single")
+            if self._file_path is not None:
+                print(self._file_path)
+                file_path = self._file_path
+            else:
+                print("DEBUG Using the current working directory")
+                file_path = os.getcwd()
+
+            print(file_path)
+            os.makedirs(file_path + "/data", exist_ok=True)
+            # TODO Make this either a tar of a zip file
+            tar_file_name = "{}/data/{}_data.tar.gz".format(file_path, message["SimName"])
             # wait for the message that says we are going to get the
             # message
             # self.wait_for_response_packet(self.message_id)
             # TODO We should wait for message receipt with a timeout.
-            raw_img_bytes = self.wait_for_response_bytes(self.message_id)
-            if raw_img_bytes:
-                if self._file_path is not None:
-                    print(self._file_path)
-                    file_path = self._file_path
-                else:
-                    print("DEBUG Using the current working directory")
-                    file_path = os.getcwd()
-                
-                print(file_path)
-                dirs = os.listdir(file_path)
-                print("DEBUG dirs: {}".format(dirs))
-                if not "data" in dirs:
-                    os.makedirs(file_path + "/data")
-                    # subprocess.run(["mkdir", "-p", "{}/data".format(os.getcwd())])
-                # TODO Make this either a tar of a zip file
-                with open("{}/data/{}_data.tar.gz".format(file_path, message["SimName"]), "wb") as file:
-                    file.write(raw_img_bytes)
-                
-                os.system("tar -xf {}/data/{}_data.tar.gz -C {}/data && rm {}/data/{}_data.tar.gz".format(file_path, message["SimName"], file_path, file_path, message["SimName"]))
-            # Only increment to the next message id if we know the last message
-            # was sent.
-            if sent:
-                self.message_id += 1
-            self.connected = False
+            # Write the tarball as it arrives, since it may be too large
+            # to hold in memory
+            with open(tar_file_name, "wb") as file:
+                numb_bytes = self.wait_for_response_bytes(self.message_id, sink=file)
+            if not numb_bytes:
+                os.remove(tar_file_name)
+            else:
+                with tarfile.open(tar_file_name, "r:gz") as tar_file:
+                    if hasattr(tarfile, "tar_filter"):
+                        # Like the tar command, refuse to write outside
+                        # the data folder
+                        tar_file.extractall(file_path + "/data", filter="tar")
+                    else:
+                        tar_file.extractall(file_path + "/data")
+                os.remove(tar_file_name)
+            self._complete_request(sent)
             print("Data download complete! Please see the Data folder!")
             return True
         except Exception:
@@ -847,29 +1257,13 @@ class SWARMClient(Thread):
           to view.
         """
         try:
-            message_packet = dict(ID=self.message_id,
-                                  Type="Singular", Body=None)
-
-            message_packet["Body"] = {
-                "Command": "Supported Environments",
-                "LicenseKey": self.retrieve_license_key(),
-                "MachineID": self.machine_id
-            }
-            json_str = json.dumps(message_packet).encode(ENCODING_SCHEME)
-
-            self.message_map[str(self.message_id)] = {
-                "Completed": False,
-                "ID": str(self.message_id)
-            }
-            sent = self.send_message(json_str)
+            sent = self._send_request({
+                "Command": "Supported Environments"
+            })
 
             completed = self.wait_for_response_packet(self.message_id)
             assert completed
-            # Only increment to the next message id if we know the last message
-            # was sent.
-            if sent:
-                self.message_id += 1
-            self.connected = False
+            self._complete_request(sent)
             return completed
         except AssertionError:
             print("Simulation failed to completed!")
@@ -880,33 +1274,26 @@ class SWARMClient(Thread):
 
     def send_env_information_message(self, message: dict) -> None:
         try:
-            message_packet = dict(ID=self.message_id, Type="Single", Body=None)
-            message["LicenseKey"] = self.retrieve_license_key()
-            message["MachineID"] = self.machine_id
-            message_packet["Body"] = message
-            self.message_map[str(self.message_id)] = {
-                "Completed": False,
-                "ID": self.message_id
-            }
-            json_str = json.dumps(message_packet).encode(ENCODING_SCHEME)
-            sent = self.send_message(json_str)
+            sent = self._send_request(message, "Single")
             # wait for the message that says we are going to get the
             # message
             # self.wait_for_response_packet(self.message_id)
             # TODO We should wait for message receipt with a timeout.
-            raw_img_bytes = self.wait_for_response_bytes(self.message_id)
-            if raw_img_bytes:
-                if self._file_path is not None:
-                    file_path = self._file_path + "/maps/map_data.tar.gz"
-                else:
-                    file_path = find_file_path("map_data.tar.gz", "maps")
-                with open(file_path, "wb") as file:
-                    file.write(raw_img_bytes)
-            # Only increment to the next message id if we know the last message
-            # was sent.
-            if sent:
-                self.message_id += 1
-            self.connected = False
+            if self._file_path is not None:
+                file_path = self._file_path + "/maps/map_data.tar.gz"
+            else:
+                file_path = find_file_path("map_data.tar.gz", "maps")
+            # Write the map as it arrives rather than holding it all in
+            # memory. It goes to a separate file first so the last map
+            # is kept if nothing is received.
+            part_file_path = file_path + ".part"
+            with open(part_file_path, "wb") as file:
+                numb_bytes = self.wait_for_response_bytes(self.message_id, sink=file)
+            if numb_bytes:
+                os.replace(part_file_path, file_path)
+            else:
+                os.remove(part_file_path)
+            self._complete_request(sent)
             return True
         except Exception:
             traceback.print_exc()
@@ -919,18 +1306,9 @@ class SWARMClient(Thread):
         be auto-detected by the Code Validation system.
         """
         try:
-            message_packet = dict(ID=self.message_id, Type="Single", Body=None)
-            message["LicenseKey"] = self.retrieve_license_key()
-            message["MachineID"] = self.machine_id
-            message["Settings"] = json.dumps(settings)
+            message["Settings"] = _json_dumps(settings).decode(ENCODING_SCHEME)
             message["UserCode"] = self.load_user_code(settings=settings)
-            message_packet["Body"] = message
-            self.message_map[str(self.message_id)] = {
-                "Completed": False,
-                "ID": self.message_id
-            }
-            json_str = json.dumps(message_packet).encode(ENCODING_SCHEME)
-            sent = self.send_message(json_str)
+            sent = self._send_request(message, "Single")
             # wait for the message that says we are going to get the
             # message
             # self.wait_for_response_packet(self.message_id)
@@ -939,17 +1317,46 @@ class SWARMClient(Thread):
             self.last_response = response
             print("Validation Results:\n")
             print(response["Body"]["ValidationResults"])
-            # Only increment to the next message id if we know the last message
-            # was sent.
-            if sent:
-                self.message_id += 1
-            self.connected = False
+            self._complete_request(sent)
             return True
         except Exception:
             traceback.print_exc()
             return False
 
 
+class _LevelConnection():
+    """
+    An extra connection to the SWARM Server, used to download levels in
+    parallel with the client's own connection. It uses the client's
+    message encoding and socket handling, but has its own socket and
+    receive buffer and none of the client's thread, queue or shutdown
+    state.
+
+    ## Arguments:
+    - client [SWARMClient] The client to open the connection for
+    - message_id [int] The id of the message sent on this connection
+    """
+    _encode_message = SWARMClient._encode_message
+    send_message = SWARMClient.send_message
+    wait_for_response_bytes = SWARMClient.wait_for_response_bytes
+    handle_multipart = SWARMClient.handle_multipart
+    _recv_json = SWARMClient._recv_json
+    _recv_exactly = SWARMClient._recv_exactly
+    _recv_into = SWARMClient._recv_into
+    _quick_ack = SWARMClient._quick_ack
+
+    def __init__(self, client: SWARMClient, message_id: int) -> None:
+        self.socket = client._open_socket()
+        self.connected = True
+        self.message_id = message_id
+        self.debug = client.debug
+        self._recv_buffer = bytearray()
+        self._json_decoder = json.JSONDecoder()
+        self._response_queue = None
+        self._message_template = client._message_template
+        self._empty_message_template = client._empty_message_template
+
+
 if __name__ == "__main__":
     client = SWARMClient("test")
     client.connect()
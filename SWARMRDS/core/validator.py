@@ -12,9 +12,21 @@ import json
 import sys
 import os
 
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_machine_fingerprint() -> str:
+  """
+  Hash the machine id used to tie a license to this machine. Reading it
+  can be slow on some platforms and it never changes while we run, so it
+  is only computed once per process.
+  """
+  return machineid.hashed_id('swarm-dev')
+
 
 def activate_license(license_key: str, account_id: str):
-  machine_fingerprint = machineid.hashed_id('swarm-dev')
+  machine_fingerprint = get_machine_fingerprint()
   validation = requests.post(
     "https://api.keygen.sh/v1/accounts/{}/licenses/actions/validate-key".format(account_id),
     headers={
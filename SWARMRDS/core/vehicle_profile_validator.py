@@ -7,11 +7,275 @@
 # Description: Validator for the Vehicle Profile JSON files that can be
 #              used to validate the vehicle profile JSON files
 # =============================================================================
+import hashlib
 import json
+import logging
+import sys
 import typing
 
+from functools import lru_cache
 from queue import Queue
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# Map of the type names used in the Supported Vehicle Physics Parameters
+# file to the Python types accepted in a Vehicle Profile
+_TYPE_MAP = {"float": float, "int": int, "str": str, "bool": bool, "list": list, "dict": dict}
+
+# Error messages returned by the compiled validator as an error key and
+# its arguments, which are only formatted when the error is reported
+_MESSAGES = {
+    "name": "Parameter name {} is not a valid parameter name!",
+    "type": "Parameter {} is not of type {}! Param Type was {}",
+    "range": "Parameter {} is not within the valid range of {} to {}!",
+    "entry": "Parameter {} is not a valid entry in the collection {}!",
+    "string": "Parameter {} is not a valid string in the collection {}!"
+}
+
+# Vehicle Profiles that have already passed validation, keyed by the
+# client path, the vehicle type and a hash of the file contents, so an
+# unchanged profile is only validated once
+_VALIDATED = set()
+
+
+@lru_cache(maxsize=8)
+def _load_valid_params(file_path: str) -> dict:
+    """
+    Load the Supported Vehicle Physics Parameters for the given client
+    path. The file is static reference data, so it is parsed once and
+    reused for every subsequent validation.
+
+    ### Inputs:
+    - `file_path` (str) The root path of the SWARM RDS Client
+
+    ### Returns:
+    - `dict` The valid physics parameters for every vehicle type
+    """
+    with open(file_path + "/SWARMRDS/core/SupportedVehiclePhysicsParameter.json", "rb") as json_file:
+        return _intern(_json_loads(json_file.read()))
+
+
+def _intern(node: typing.Any) -> typing.Any:
+    """
+    Intern every string in the parsed JSON. The schema repeats the same
+    keys and type names hundreds of times and is reused for every
+    validation, so interning lets lookups short-circuit on identity.
+    """
+    if isinstance(node, dict):
+        return {sys.intern(key): _intern(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_intern(value) for value in node]
+    if isinstance(node, str):
+        return sys.intern(node)
+    return node
+
+
+class _ParamInfo(typing.NamedTuple):
+    """
+    The validation rules for a single physics parameter.
+    """
+    type_name: str
+    min: typing.Any = None
+    max: typing.Any = None
+    valid_entries: typing.Any = None
+    valid_entry_set: typing.Any = None
+    allow_any: bool = True
+
+
+def _build_flat_schema(valid_params: dict) -> tuple:
+    """
+    Flatten the nested "ValidSubSections" structure of the valid
+    parameters for a vehicle type into a single map keyed by the path
+    of each parameter, e.g. ("Frame", "BodyBox", "X"). Subsections are
+    limited to two levels deep for simplicity.
+
+    ### Inputs:
+    - `valid_params` (dict) The valid parameters for a vehicle type
+
+    ### Returns:
+    - `dict` The _ParamInfo of each parameter keyed by its path
+    - `frozenset` The paths of every subsection
+    """
+    params = dict()
+    sections = set()
+
+    def _flatten(schema: dict, path: tuple) -> None:
+        subsections = schema.get("ValidSubSections", ())
+        for name, info in schema.items():
+            if not isinstance(info, dict):
+                continue
+            if name in subsections and len(path) < 2:
+                sections.add(path + (name,))
+                _flatten(info, path + (name,))
+            elif "Type" in info:
+                params[path + (name,)] = _ParamInfo(info["Type"], info.get("Min"), info.get("Max"), *_valid_entries(info.get("ValidEntries")))
+
+    _flatten(valid_params, ())
+
+    return params, frozenset(sections)
+
+
+def _valid_entries(entries: typing.Any) -> tuple:
+    """
+    Convert the "ValidEntries" of a parameter into a frozenset for
+    constant time membership checks, and flag whether any entry is
+    allowed, i.e. the entries are missing or are the ["*"] wildcard.
+
+    ### Returns:
+    - The valid entries as given, for reporting
+    - The valid entries to check membership against
+    - Whether any entry is allowed
+    """
+    if entries is None or entries == ["*"]:
+        return entries, None, True
+    try:
+        return entries, frozenset(entries), False
+    except TypeError:
+        # Unhashable entries can only be searched as a list
+        return entries, entries, False
+
+
+@lru_cache(maxsize=8)
+def _load_flat_schema(file_path: str, vehicle_type: str) -> tuple:
+    """
+    Load and flatten the valid parameters for the given vehicle type.
+    See `_build_flat_schema`.
+    """
+    return _build_flat_schema(_load_valid_params(file_path)[vehicle_type])
+
+
+def _emit_type_check(param_name: str, param_info: _ParamInfo) -> list:
+    """
+    Generate the lines checking that a parameter is of the correct type.
+    """
+    expected = _TYPE_MAP.get(param_info.type_name)
+    if expected is None:
+        condition = "type(value).__name__ != {!r}".format(param_info.type_name)
+    elif expected is int:
+        # bool is a subclass of int, but is not a valid int parameter
+        condition = "not isinstance(value, int) or isinstance(value, bool)"
+    else:
+        condition = "not isinstance(value, {})".format(expected.__name__)
+
+    return ["    if {}:".format(condition),
+            "        return 'type', ({!r}, {!r}, type(value).__name__)".format(param_name, param_info.type_name)]
+
+
+def _emit_numeric_check(param_name: str, param_info: _ParamInfo, entries_name: str) -> list:
+    """
+    Generate the lines checking that a number is within the valid range
+    and, if given, is one of the valid entries.
+    """
+    lines = ["    if value < {!r} or value > {!r}:".format(param_info.min, param_info.max),
+             "        return 'range', ({!r}, {!r}, {!r})".format(param_name, param_info.min, param_info.max)]
+    if not param_info.allow_any:
+        lines += ["    if value not in {}:".format(entries_name),
+                  "        return 'entry', ({!r}, {}_list)".format(param_name, entries_name)]
+
+    return lines
+
+
+def _emit_str_check(param_name: str, param_info: _ParamInfo, entries_name: str) -> list:
+    """
+    Generate the lines checking that if the value is a string as a part
+    of a collection that it is a valid string in the collection.
+    """
+    if param_info.allow_any:
+        return []
+
+    return ["    if value not in {}:".format(entries_name),
+            "        return 'string', ({!r}, {}_list)".format(param_name, entries_name)]
+
+
+# Checks to generate once the type of a parameter has been confirmed,
+# keyed by the type name used in the valid parameters
+_CHECK_EMITTERS = {
+    "float": _emit_numeric_check,
+    "int": _emit_numeric_check,
+    "str": _emit_str_check
+}
+
+
+def _compile_schema(valid_params: dict, subsections: frozenset) -> typing.Callable:
+    """
+    Generate a validation function specialized to the flattened valid
+    parameters of a vehicle type. Every parameter gets its own function
+    with its type and range checks written out as literals, and every
+    section dispatches to the functions of its members through a single
+    dictionary lookup, so validating a profile does no schema walking.
+
+    ### Inputs:
+    - `valid_params` (dict) The _ParamInfo of each parameter keyed by
+                            its path
+    - `subsections` (frozenset) The paths of every subsection
+
+    ### Returns:
+    - `Callable` Taking the "Physics" section of a Vehicle Profile and
+                 returning None if it is valid, else the key of the
+                 error in `_MESSAGES` and the arguments to format it
+    """
+    namespace = dict()
+    lines = list()
+    # The name of the function that validates each path, and the members
+    # of each section
+    functions = dict()
+    members = {(): dict()}
+    for path in subsections:
+        members[path] = dict()
+
+    for i, (path, param_info) in enumerate(valid_params.items()):
+        functions[path] = "_param_{}".format(i)
+        entries_name = "_entries_{}".format(i)
+        namespace[entries_name] = param_info.valid_entry_set
+        namespace[entries_name + "_list"] = param_info.valid_entries
+        lines.append("def {}(value):".format(functions[path]))
+        lines += _emit_type_check(path[-1], param_info)
+        emitter = _CHECK_EMITTERS.get(param_info.type_name)
+        if emitter is not None:
+            lines += emitter(path[-1], param_info, entries_name)
+        lines += ["    return None", ""]
+
+    for i, path in enumerate(members):
+        functions[path] = "_section_{}".format(i)
+        lines += ["def {}(section):".format(functions[path]),
+                  "    for name, value in section.items():",
+                  "        check = _members_{}.get(name)".format(i),
+                  "        if check is None:",
+                  "            return 'name', (name,)",
+                  "        error = check(value)",
+                  "        if error is not None:",
+                  "            return error",
+                  "    return None",
+                  ""]
+
+    for path in functions:
+        if path:
+            members[path[:-1]][path[-1]] = path
+
+    source = "\n".join(lines)
+    logger.debug("Generated vehicle profile validator:\n%s", source)
+    exec(compile(source, "<vehicle profile validator>", "exec"), namespace)
+
+    for i, section_members in enumerate(members.values()):
+        namespace["_members_{}".format(i)] = {name: namespace[functions[path]] for name, path in section_members.items()}
+
+    return namespace[functions[()]]
+
+
+@lru_cache(maxsize=8)
+def _load_validator(file_path: str, vehicle_type: str) -> typing.Callable:
+    """
+    Load the valid parameters for the given vehicle type and compile
+    them into a validation function. See `_compile_schema`.
+    """
+    return _compile_schema(*_load_flat_schema(file_path, vehicle_type))
+
 
 class VehicleProfileValidator:
     """
@@ -42,8 +306,8 @@ class VehicleProfileValidator:
         
         # Load the JSON file
         try:
-            with open(self._file_path + "/vehicle_profiles/" + self._file_name, "r") as json_file:
-                json_data = json.load(json_file)
+            with open(self._file_path + "/vehicle_profiles/" + self._file_name, "rb") as json_file:
+                profile_bytes = json_file.read()
         except FileNotFoundError:
             if self._client_mode:
                 self._response_queue.put({"Command": "ValidatePhysicsProfile", "Message": "Vehicle Profile with name {} not found!".format(self._file_name)})
@@ -51,11 +315,19 @@ class VehicleProfileValidator:
                 print("Vehicle Profile not found!")
             return False
 
+        # An identical profile that has already been validated for this
+        # vehicle type does not need to be checked again
+        cache_key = (self._file_path, self._vehicle_type, hashlib.blake2b(profile_bytes, digest_size=16).digest())
+        if cache_key in _VALIDATED:
+            self._report("Vehicle Profile Validated Successfully!")
+            return True
+
+        json_data = _json_loads(profile_bytes)
+
         # Load the Valid Physics Parameters
 
         try:
-            with open(self._file_path + "/SWARMRDS/core/SupportedVehiclePhysicsParameter.json", "r") as json_file:
-                valid_params = json.load(json_file)
+            validator = _load_validator(self._file_path, self._vehicle_type)
         except FileNotFoundError:
             if self._client_mode:
                 self._response_queue.put({"Command": "ValidatePhysicsProfile", "Message": "Valid Physics Parameters file not found in {}/SWARMRDS/core! Please ensure you have at least version 1.4.0 of the Client installed!".format(self._file_path)})
@@ -63,120 +335,31 @@ class VehicleProfileValidator:
                 print("Valid Physics Parameters not found!")
                 print("File path was {}/SWARMRDS/core".format(self._file_path))
             return False
-        
-        # Retrive the valid parameters for the vehicle type
-        valid_params = valid_params[self._vehicle_type]
-
-        # Note that we have different sub-sections that exist. So it is
-        # important to check each one individually by the Sub Section
-        subsections = valid_params["ValidSubSections"]
-        # Check the JSON file for the valid parameters
-        for param_name, param_value in json_data["Physics"].items():
-            print("DEBUG Parameter Name: {}".format(param_name))
-            print("DEBUG Parameter name in subsections: {}".format(param_name in subsections))
-            # First, check if the param_name is actually a subsection
-            if param_name in subsections:
-                for sub_param_name, sub_param_value in param_value.items():
-                 
-                    # Check the next level down to see if there is another
-                    # subsection. Limit this to two levels deep for simplicity
-                    if "ValidSubSections" in valid_params[param_name].keys() and sub_param_name in valid_params[param_name]["ValidSubSections"]:
-                        # Final level to iterate through
-                        for sub_sub_param_name, sub_sub_param_value in sub_param_value.items():
-                        
-                            # Check the value of the parameter
-                            valid, error_msg =  self._check_param_value(sub_sub_param_name, sub_sub_param_value, valid_params, param_name, sub_param_name)
-
-                            if not valid:
-                                if self._client_mode:
-                                    self._response_queue.put({"Command": "ValidatePhysicsProfile", "Message": error_msg})
-                                else:
-                                    print(error_msg)
-                                return False
-                    else:
-                        # Check the value of the parameter
-                        valid, error_msg =  self._check_param_value(sub_param_name, sub_param_value, valid_params, param_name)
-
-                        if not valid:
-                            if self._client_mode:
-                                self._response_queue.put({"Command": "ValidatePhysicsProfile", "Message": error_msg})
-                            else:
-                                print(error_msg)
-                            return False
-            else:
-                # Check the value of the parameter
-                valid, error_msg =  self._check_param_value(param_name, param_value, valid_params)
 
-                if not valid:
-                    if self._client_mode:
-                        self._response_queue.put({"Command": "ValidatePhysicsProfile", "Message": error_msg})
-                    else:
-                        print(error_msg)
-                    return False
+        # Note that we have different sub-sections that exist, each of
+        # which is checked individually by the compiled validator
+        error = validator(json_data["Physics"])
 
-        if self._client_mode:
-            self._response_queue.put({"Command": "ValidatePhysicsProfile", "Message": "Vehicle Profile Validated Successfully!"})
+        if error is not None:
+            error_key, args = error
+            msg = _MESSAGES[error_key].format(*args)
         else:
-            print("Vehicle Profile Validated Successfully!")
+            msg = "Vehicle Profile Validated Successfully!"
+            _VALIDATED.add(cache_key)
 
-        return True           
+        self._report(msg)
 
-    def _check_param_value(self, param_name: str, param_value: typing.Any, valid_params: dict, sub_param_name: str = None, sub_sub_param_name: str = None) -> bool:
+        return error is None
+
+    def _report(self, msg: str) -> None:
         """
-        Validate the parameter using the param name and access the lower
-        values using the sub and sub sub param names as needed.
-
-        ### Inputs:
-        - `param_name` (str) The name of the parameter to check
-        - `param_value` (Any) The value of the parameter to check
-        - `valid_params` (dict) The valid parameters to check against
-        - `sub_param_name` (str) The name of the sub parameter to check
-        - `sub_sub_param_name` (str) The name of the sub sub parameter to check
-
-        ### Returns:
-        - `bool` Whether or not the parameter value is valid
+        Report the result of the validation, either to the response
+        queue in client mode or to the console.
         """
-        print("DEBUG Validating parameter with name {} and value {}".format(param_name, param_value))
-
-        # Check the parameter name is actually in the valid parameters
-        if sub_param_name is not None:
-            if sub_param_name not in valid_params.keys():
-                return False, "Sub Parameter name {} is not a valid parameter name!".format(sub_param_name)
-            if sub_sub_param_name is not None:
-                if sub_sub_param_name not in valid_params[sub_param_name].keys():
-                    print(sub_sub_param_name, valid_params[sub_param_name].keys())
-                    return False, "Sub Sub Parameter name {} is not a valid parameter name in {}!".format(sub_sub_param_name, sub_param_name)
-                if param_name not in valid_params[sub_param_name][sub_sub_param_name].keys():
-                    return False, "Parameter name {} is not a valid parameter name!".format(param_name)
-                param_info = valid_params[sub_param_name][sub_sub_param_name][param_name]
-            else:
-                if param_name not in valid_params[sub_param_name].keys():
-                    return False, "Parameter name {} is not a valid parameter name!".format(param_name)
-                param_info = valid_params[sub_param_name][param_name]
+        if self._client_mode:
+            self._response_queue.put({"Command": "ValidatePhysicsProfile", "Message": msg})
         else:
-            if param_name not in valid_params.keys():
-                return False, "Parameter name {} is not a valid parameter name!".format(param_name)
-            param_info = valid_params[param_name]
-
-        # Check that the type of the parameter is correct
-        if type(param_value).__name__ != param_info["Type"]:
-            return False, "Parameter {} is not of type {}! Param Type was {}".format(param_name, param_info["Type"], type(param_value).__name__)
-        
-        # Check that the value is within the valid range if it is a number
-        if param_info["Type"] == "float" or param_info["Type"] == "int":
-            if param_value < param_info["Min"] or param_value > param_info["Max"]:
-                return False, "Parameter {} is not within the valid range of {} to {}!".format(param_name, param_info["Min"], param_info["Max"])
-            if "ValidEntries" in param_info.keys():
-                if param_value not in param_info["ValidEntries"]:
-                    return False, "Parameter {} is not a valid entry in the collection {}!".format(param_name, param_info["ValidEntries"])
-        
-        # Check that if the value is a string as a part of a collection that
-        # it is a valid string in the collection
-        if param_info["Type"] == "str":
-            if param_info["ValidEntries"] != ["*"] and param_value not in param_info["ValidEntries"]:
-                return False, "Parameter {} is not a valid string in the collection {}!".format(param_name, param_info["ValidStrings"])
-        
-        return True, None
+            print(msg)
 
 
 if __name__ == "__main__":
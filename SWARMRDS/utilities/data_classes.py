@@ -8,15 +8,22 @@
 # Description: AirSim interface file for the SWARM platform
 # =============================================================================
 import math
+import sys
 import numpy as np
-import copy
 
 from dataclasses import dataclass, field
 from enum import Enum, unique
-from math import sqrt
 
+# Slotted dataclasses drop the per-instance __dict__, which keeps the
+# many small vectors created at telemetry rates compact. Slots are only
+# supported by dataclass from Python 3.10 onwards.
+if sys.version_info >= (3, 10):
+    _slotted_dataclass = dataclass(slots=True)
+else:
+    _slotted_dataclass = dataclass
 
-@dataclass
+
+@_slotted_dataclass
 class PosVec3:
     """
     Position vector containing the X, Y and Z coordinates as defined
@@ -43,19 +50,23 @@ class PosVec3:
            self.Z 
         ])
 
+    def toNumpyArrayInto(self, out: np.ndarray) -> np.ndarray:
+        """
+        Write the vector into an existing array of at least three
+        elements, avoiding an allocation on every call.
+        """
+        out[0] = self.X
+        out[1] = self.Y
+        out[2] = self.Z
+        return out
+
     def toENU(self):
-        temp_x = copy.deepcopy(self.X)
-        self.X = self.Y
-        self.Y = temp_x
-        self.Z = -self.Z
+        self.X, self.Y, self.Z = self.Y, self.X, -self.Z
         self.NED = False
         self.ENU = True
 
     def toNED(self):
-        temp_x = copy.deepcopy(self.X)
-        self.X = self.Y
-        self.Y = temp_x
-        self.Z = -self.Z
+        self.X, self.Y, self.Z = self.Y, self.X, -self.Z
         self.NED = True
         self.ENU = False
 
@@ -71,7 +82,98 @@ class PosVec3:
         return [self.X, self.Y, self.Z]
 
 
-@dataclass
+class PosVec3Array:
+    """
+    A collection of position vectors stored as a single (N, 3) array of
+    X, Y and Z coordinates, rather than as individual PosVec3 objects.
+    Allows geometry over many points, such as a trajectory, to be
+    computed in one vectorized operation.
+
+    Units are Meters.
+
+    Members are:
+    - xyz: (N, 3) array of the X, Y and Z coordinates of each point
+    - frame: The coordinate frame shared by all points
+    - NED: Whether the points are in the NED coordinate frame
+    """
+    __slots__ = ("_buffer", "_size", "frame", "NED")
+
+    def __init__(self, xyz: np.ndarray = None, frame: str = "body", NED: bool = True) -> None:
+        if xyz is None:
+            xyz = np.empty((0, 3), dtype=np.float64)
+        # Rows past _size are spare capacity, so that appending a point
+        # doesn't copy the whole array every time
+        self._buffer = np.array(xyz, dtype=np.float64).reshape(-1, 3)
+        self._size = len(self._buffer)
+        self.frame = frame
+        self.NED = NED
+
+    @property
+    def xyz(self) -> np.ndarray:
+        return self._buffer[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> PosVec3:
+        X, Y, Z = self.xyz[index].tolist()
+        return PosVec3(X=X, Y=Y, Z=Z, frame=self.frame, NED=self.NED, ENU=not self.NED)
+
+    def __iter__(self):
+        for X, Y, Z in self.xyz.tolist():
+            yield PosVec3(X=X, Y=Y, Z=Z, frame=self.frame, NED=self.NED, ENU=not self.NED)
+
+    def _reserve(self, size: int) -> None:
+        """
+        Grow the buffer to hold at least `size` points, doubling it so
+        that appends are amortized constant time.
+        """
+        if size > len(self._buffer):
+            buffer = np.empty((max(size, 2 * len(self._buffer), 8), 3), dtype=np.float64)
+            buffer[:self._size] = self.xyz
+            self._buffer = buffer
+
+    def append(self, X: float, Y: float, Z: float) -> None:
+        self._reserve(self._size + 1)
+        self._buffer[self._size] = (X, Y, Z)
+        self._size += 1
+
+    def extend(self, xyz: np.ndarray) -> None:
+        """
+        Add a (N, 3) array of X, Y and Z coordinates to the end.
+        """
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        self._reserve(self._size + len(xyz))
+        self._buffer[self._size:self._size + len(xyz)] = xyz
+        self._size += len(xyz)
+
+    def distances_to(self, other) -> np.ndarray:
+        """
+        Distance in meters from each point to the matching point in
+        another PosVec3Array or (N, 3) array.
+        """
+        other_xyz = other.xyz if isinstance(other, PosVec3Array) else other
+        return np.linalg.norm(self.xyz - other_xyz, axis=1)
+
+    def segment_lengths(self) -> np.ndarray:
+        """
+        Distance in meters between each consecutive pair of points.
+        """
+        return np.linalg.norm(np.diff(self.xyz, axis=0), axis=1)
+
+    def to_list_of_dicts(self) -> list:
+        return [{"X": X,
+                 "Y": Y,
+                 "Z": Z,
+                 "Frame": self.frame,
+                 "ENU": not self.NED,
+                 "NED": self.NED} for X, Y, Z in self.xyz.tolist()]
+
+    def displayPretty(self) -> list:
+        return self.to_list_of_dicts()
+
+
+@_slotted_dataclass
 class GPSPosVec3:
     """
     Position vector containing the Latitude, Longitude and Altitude
@@ -103,7 +205,51 @@ class GPSPosVec3:
                 "Longitude": self.Lon,
                 "Altitude": self.Alt}
 
-@dataclass
+
+@_slotted_dataclass
+class GPSPosVec3Array:
+    """
+    A collection of GPS positions stored as a single (N, 3) array of
+    Latitude, Longitude and Altitude, rather than as individual
+    GPSPosVec3 objects, allowing conversions to be vectorized.
+
+    Members are:
+    - lla: (N, 3) array of the Latitude and Longitude in degrees and the
+           Altitude in meters of each point
+    """
+    lla: np.ndarray = field(default_factory=lambda: np.empty((0, 3), dtype=np.float64))
+
+    def __post_init__(self) -> None:
+        # Conversions such as toRadians write back into the array, so it
+        # must hold floats even when given whole degrees
+        self.lla = np.asarray(self.lla, dtype=np.float64).reshape(-1, 3)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, GPSPosVec3Array):
+            return NotImplemented
+        return np.array_equal(self.lla, other.lla)
+
+    def __len__(self) -> int:
+        return len(self.lla)
+
+    def __getitem__(self, index: int) -> GPSPosVec3:
+        Lat, Lon, Alt = self.lla[index].tolist()
+        return GPSPosVec3(Lat=Lat, Lon=Lon, Alt=Alt)
+
+    def __iter__(self):
+        for Lat, Lon, Alt in self.lla.tolist():
+            yield GPSPosVec3(Lat=Lat, Lon=Lon, Alt=Alt)
+
+    def toRadians(self):
+        np.deg2rad(self.lla[:, :2], out=self.lla[:, :2])
+
+    def displayPretty(self) -> list:
+        return [{"Latitude": Lat,
+                 "Longitude": Lon,
+                 "Altitude": Alt} for Lat, Lon, Alt in self.lla.tolist()]
+
+
+@_slotted_dataclass
 class VelVec3:
     """
     Velocity vector containing the X, Y and Z velocities as measured
@@ -130,19 +276,23 @@ class VelVec3:
            self.vz 
         ])
 
+    def toNumpyArrayInto(self, out: np.ndarray) -> np.ndarray:
+        """
+        Write the vector into an existing array of at least three
+        elements, avoiding an allocation on every call.
+        """
+        out[0] = self.vx
+        out[1] = self.vy
+        out[2] = self.vz
+        return out
+
     def toENU(self):
-        temp_x = copy.deepcopy(self.vx)
-        self.vx = self.vy
-        self.vy = temp_x
-        self.vz = -self.vz
+        self.vx, self.vy, self.vz = self.vy, self.vx, -self.vz
         self.NED = False
         self.ENU = True
 
     def toNED(self):
-        temp_x = copy.deepcopy(self.vx)
-        self.vx = self.vy
-        self.vy = temp_x
-        self.vz = -self.vz
+        self.vx, self.vy, self.vz = self.vy, self.vx, -self.vz
         self.NED = True
         self.ENU = False
 
@@ -155,7 +305,7 @@ class VelVec3:
                 "NED": self.NED}
 
 
-@dataclass
+@_slotted_dataclass
 class AccVec3:
     """
     Velocity vector containing the X, Y and Z velocities as measured
@@ -182,19 +332,23 @@ class AccVec3:
            self.az 
         ])
 
+    def toNumpyArrayInto(self, out: np.ndarray) -> np.ndarray:
+        """
+        Write the vector into an existing array of at least three
+        elements, avoiding an allocation on every call.
+        """
+        out[0] = self.ax
+        out[1] = self.ay
+        out[2] = self.az
+        return out
+
     def toENU(self):
-        temp_x = copy.deepcopy(self.ax)
-        self.ax = self.ay
-        self.ay = temp_x
-        self.az = -self.az
+        self.ax, self.ay, self.az = self.ay, self.ax, -self.az
         self.NED = False
         self.ENU = True
 
     def toNED(self):
-        temp_x = copy.deepcopy(self.ax)
-        self.ax = self.ay
-        self.ay = temp_x
-        self.az = -self.az
+        self.ax, self.ay, self.az = self.ay, self.ax, -self.az
         self.NED = True
         self.ENU = False
 
@@ -207,7 +361,7 @@ class AccVec3:
                 "NED": self.NED}
 
 
-@dataclass
+@_slotted_dataclass
 class ECEF():
     """
     A position in Earth Centered Earth Facing coordinates. This position
@@ -225,7 +379,7 @@ class ECEF():
             "Z": self.Z
         }
 
-@dataclass
+@_slotted_dataclass
 class AccelVec4:
     """
     Acceleration vector containing the acceleration to apply along the
@@ -254,6 +408,16 @@ class AccelVec4:
            self.yaw 
         ])
 
+    def toNumpyArrayInto(self, out: np.ndarray) -> np.ndarray:
+        """
+        Write the vector into an existing array of at least three
+        elements, avoiding an allocation on every call.
+        """
+        out[0] = self.roll
+        out[1] = self.pitch
+        out[2] = self.yaw
+        return out
+
     def displayPretty(self) -> dict:
         return {"roll": self.roll,
                 "pitch": self.pitch,
@@ -261,7 +425,7 @@ class AccelVec4:
                 "throttle": self.throttle}
 
 
-@dataclass
+@_slotted_dataclass
 class Quaternion:
     """
     Rotation quaternion that represents the orientation of a body
@@ -286,24 +450,15 @@ class Quaternion:
     ENU: bool = False
 
     def length(self) -> float:
-        return sqrt(pow(self.w, 2)
-                    + pow(self.x, 2)
-                    + pow(self.y, 2)
-                    + pow(self.z, 2))
+        return math.hypot(self.w, self.x, self.y, self.z)
 
     def toENU(self) -> None:
-        x = copy.deepcopy(self.x)
-        self.x = copy.deepcopy(self.y)
-        self.y = x
-        self.z = -self.z
+        self.x, self.y, self.z = self.y, self.x, -self.z
         self.NED = False
         self.ENU = True
 
     def toNED(self) -> None:
-        x = copy.deepcopy(self.x)
-        self.x = copy.deepcopy(self.y)
-        self.y = x
-        self.z = -self.z
+        self.x, self.y, self.z = self.y, self.x, -self.z
         self.NED = True
         self.ENU = False
     
@@ -317,11 +472,11 @@ class Quaternion:
         Divdes each comnponent of the quaternion by the length of the
         quaternion, return each component as a float.
         """
-        length = self.length()
-        self.x = self.x / length
-        self.y = self.y / length
-        self.z = self.z / length
-        self.w = self.w / length
+        inv_length = 1.0 / self.length()
+        self.x *= inv_length
+        self.y *= inv_length
+        self.z *= inv_length
+        self.w *= inv_length
 
     def displayPretty(self) -> dict:
         return {"x": self.x,
@@ -330,7 +485,7 @@ class Quaternion:
                 "w": self.w}
 
 
-@dataclass
+@_slotted_dataclass
 class Attitude:
     """
     The current attitude of the aircraft in the NED coordinate frame,
@@ -353,7 +508,7 @@ class Attitude:
                 "yaw": self.yaw}
 
 
-@dataclass
+@_slotted_dataclass
 class AgentState:
     """
     Compact representation of the agents current state, with a similar
@@ -380,7 +535,7 @@ class AgentState:
     attitude: Attitude = field(default_factory=Attitude)
     heading: float = float()
 
-@dataclass
+@_slotted_dataclass
 class Orientation:
     """
     Current orientation of the vehicle, as given by a set of angles in 
@@ -398,7 +553,7 @@ class Orientation:
     quat: Quaternion = field(default_factory=Quaternion)
 
 
-@dataclass
+@_slotted_dataclass
 class MovementCommand():
     """
     AirSim requires a Movement command, which contains a number of
@@ -436,7 +591,7 @@ class MovementCommand():
         return display_dict
 
 
-@dataclass
+@_slotted_dataclass
 class Trajectory():
     """
     A multi-point path that should be followed by the agent. Can be
@@ -454,6 +609,26 @@ class Trajectory():
     start_time: float = 0.0
     end_time: float = 0.0
 
+    @classmethod
+    def from_arrays(cls, xs: np.ndarray, ys: np.ndarray, z: float, speed: float, headings: np.ndarray):
+        """
+        Create a trajectory of MovementCommands from arrays of the X and
+        Y positions and headings of each point, all at the same altitude
+        and speed.
+
+        ## Inputs:
+        - xs [np.ndarray] X position of each point in meters
+        - ys [np.ndarray] Y position of each point in meters
+        - z [float] Altitude of every point in meters
+        - speed [float] Speed to travel in meters per second
+        - headings [np.ndarray] Heading at each point in degrees
+        """
+        trajectory = cls()
+        trajectory.points = [MovementCommand(position=PosVec3(X=x, Y=y, Z=z), heading=heading, speed=speed)
+                             for x, y, heading in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist(), np.asarray(headings).tolist())]
+
+        return trajectory
+
     def convert_dict_to_traj(self, traj_dict: dict) -> None:
         """
         Given a list of waypoints as a set of dictionaries with the
@@ -465,8 +640,7 @@ class Trajectory():
         }
         create a valid trajectory to be given to the algorithm.
         """
-        for point in traj_dict:
-            self.points.append(PosVec3(X=point["X"], Y=point["Y"], Z=point["Z"]))
+        self.points.extend([PosVec3(X=point["X"], Y=point["Y"], Z=point["Z"]) for point in traj_dict])
 
     def convert_list_to_traj_with_heading_and_speed(self, traj: list) -> None:
         """
@@ -481,7 +655,28 @@ class Trajectory():
         """
         for point in traj:
             self.points.append((PosVec3(X=point["X"], Y=point["Y"], Z=point["Z"]), point["Heading"], point["Speed"]))
-    
+
+    def to_pos_vec3_array(self) -> PosVec3Array:
+        """
+        Copy the positions of the points into a PosVec3Array, so that
+        geometry over the whole trajectory can be vectorized. The array
+        is built from the current points each time, so it is never out
+        of date.
+
+        ## Outputs:
+        - The positions of the points, in order
+        """
+        xyz = np.empty((len(self.points), 3), dtype=np.float64)
+        for i, point in enumerate(self.points):
+            # Points may be PosVec3s, MovementCommands or tuples of a
+            # PosVec3, heading and speed
+            if isinstance(point, tuple):
+                point = point[0]
+            if isinstance(point, MovementCommand):
+                point = point.position
+            xyz[i] = (point.X, point.Y, point.Z)
+        return PosVec3Array(xyz=xyz)
+
     def displayPretty(self) -> dict:
         traj_points = list()
         for point in self.points:
@@ -490,7 +685,7 @@ class Trajectory():
         return traj_points
 
 
-@dataclass
+@_slotted_dataclass
 class Detection():
     """
     We generate a number of detections, whether through the AirSim
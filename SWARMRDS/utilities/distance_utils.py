@@ -1,6 +1,7 @@
 import math
+import numpy as np
 
-from SWARMRDS.utilities.data_classes import PosVec3
+from SWARMRDS.utilities.data_classes import PosVec3, PosVec3Array
 
 
 def ned_position_difference(first_pos: PosVec3,
@@ -16,6 +17,35 @@ def ned_position_difference(first_pos: PosVec3,
     ### Return:
     - The difference in position in meters
     """
-    return math.sqrt(pow((first_pos.X - second_pos.X), 2)
-                     + pow((first_pos.Y - second_pos.Y), 2)
-                     + pow((first_pos.Z - second_pos.Z), 2))
\ No newline at end of file
+    return math.hypot(first_pos.X - second_pos.X,
+                      first_pos.Y - second_pos.Y,
+                      first_pos.Z - second_pos.Z)
+
+
+def ned_position_difference_batch(first_points, second_points) -> np.ndarray:
+    """
+    Calculate the absolute difference between each pair of positions
+    in two equally sized collections of points.
+
+    ### Inputs:
+    - first_points [np.ndarray | PosVec3Array | list[PosVec3]] A (N, 3)
+                   array of X, Y, Z positions or a list of positions
+    - second_points [np.ndarray | PosVec3Array | list[PosVec3]] A (N, 3)
+                    array of X, Y, Z positions or a list of positions
+
+    ### Return:
+    - A (N,) array of the differences in position in meters
+    """
+    return np.linalg.norm(_as_xyz_array(first_points) - _as_xyz_array(second_points), axis=1)
+
+
+def _as_xyz_array(points) -> np.ndarray:
+    """
+    Convert a collection of points into a (N, 3) array of X, Y, Z
+    positions.
+    """
+    if isinstance(points, PosVec3Array):
+        return points.xyz
+    if isinstance(points, np.ndarray):
+        return points.reshape(-1, 3)
+    return np.array([point.toList() for point in points], dtype=np.float64).reshape(-1, 3)
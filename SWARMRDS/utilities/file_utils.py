@@ -8,57 +8,51 @@
 # Description: Utilities for loading and using file
 # =============================================================================
 import os
-import sys
 
+# Paths that have been found, keyed by the working directory they were
+# searched from and the folder and file that were searched for. Misses
+# are not cached, as the file may be created later on.
+_FOUND_PATHS = dict()
 
-def find_folder_path(folder_name: str) -> str:
+
+def _find(folder_name: str, file_name: str = None) -> str:
     """
-    Find the path to the given folder by seraching in different
-    directories, going up to 3 levels back
+    Find the given folder, or the given file within the folder, by
+    searching the current directory and going up to 3 levels back.
+
+    ### Inputs:
+    - `folder_name` (str) The name of the folder to find
+    - `file_name` (str) The name of the file in the folder to find
+
+    ### Outputs:
+    - The path to the folder or file, or an empty string if not found
     """
-    try:
-        folder_path = os.path.join(os.getcwd(), folder_name)
-        if os.path.exists(folder_path):
-            return folder_path
-        else:
-            raise FileNotFoundError(
-                "Folder not found in the current directory: {}".format(folder_path)
-            )
-    except FileNotFoundError:
-        print("DEBUG Attempting to go back one directory")
+    cwd = os.getcwd()
+    key = (cwd, folder_name, file_name)
+    path = _FOUND_PATHS.get(key)
+    if path is not None:
+        return path
 
-    try:
-        folder_path = os.path.join(os.getcwd(), "..", folder_name)
-        if os.path.exists(folder_path):
-            return folder_path
+    base = cwd
+    for _ in range(4):
+        if file_name is None:
+            path = os.path.join(base, folder_name)
         else:
-            raise FileNotFoundError(
-                "Folder not found in {} directory: {}".format(folder_name, folder_path)
-            )
-    except FileNotFoundError:
-        print("DEBUG Attempting to go back two directories")
+            path = os.path.join(base, folder_name, file_name)
+        if os.path.exists(path):
+            _FOUND_PATHS[key] = path
+            return path
+        base = os.path.dirname(base)
 
-    try:
-        folder_path = os.path.join(os.getcwd(), "..", "..", folder_name)
-        if os.path.exists(folder_path):
-            return folder_path
-        else:
-            raise FileNotFoundError(
-                "Folder not found in {} directory: {}".format(folder_name, folder_path)
-            )
-    except FileNotFoundError:
-        print("DEBUG Attempting to go back three directories")
+    return ""
 
-    try:
-        folder_path = os.path.join(os.getcwd(), "..", "..", "..", folder_name)
-        if os.path.exists(folder_path):
-            return folder_path
-        else:
-            raise FileNotFoundError(
-                "Folder not found in {} directory: {}".format(folder_name, folder_path)
-            )
-    except FileNotFoundError:
-        return ""
+
+def find_folder_path(folder_name: str) -> str:
+    """
+    Find the path to the given folder by seraching in different
+    directories, going up to 3 levels back
+    """
+    return _find(folder_name)
 
 
 def find_file_path(file_name: str, folder: str) -> str:
@@ -66,47 +60,4 @@ def find_file_path(file_name: str, folder: str) -> str:
     Find the given file and folder by searching paths directly
     from where this application is being run.
     """
-    try:
-        file_path = os.path.join(os.getcwd(), folder, file_name)
-        if os.path.exists(file_path):
-            return file_path
-        else:
-            raise FileNotFoundError(
-                "File not found in the current directory: {}".format(file_path)
-            )
-    except FileNotFoundError:
-        print("DEBUG Attempting to go back one directory")
-
-    try:
-        file_path = os.path.join(os.getcwd(), "..", folder, file_name)
-        if os.path.exists(file_path):
-            return file_path
-        else:
-            raise FileNotFoundError(
-                "File not found in {} directory: {}".format(file_name, file_path)
-            )
-    except FileNotFoundError:
-        print("DEBUG Attempting to go back two directories")
-
-    try:
-        file_path = os.path.join(os.getcwd(), "..", "..", folder, file_name)
-        print("DEBUG File path is {}".format(file_path))
-        if os.path.exists(file_path):
-            return file_path
-        else:
-            raise FileNotFoundError(
-                "File not found in {} directory: {}".format(file_name, file_path)
-            )
-    except FileNotFoundError:
-        print("DEBUG Attempting to go back three directories")
-
-    try:
-        file_path = os.path.join(os.getcwd(), "..", "..", "..", folder, file_name)
-        if os.path.exists(file_path):
-            return file_path
-        else:
-            raise FileNotFoundError(
-                "File not found in {} directory: {}".format(file_name, file_path)
-            )
-    except FileNotFoundError:
-        return ""
\ No newline at end of file
+    return _find(folder, file_name)
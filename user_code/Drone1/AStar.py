@@ -7,19 +7,282 @@
 #
 # Description: An implementation of A* in SWARM
 # =============================================================================
+import heapq
 import math
 import numpy as np
-import pickle
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-import time
 import logging
 
 from SWARMRDS.utilities.algorithm_utils import Algorithm
-from SWARMRDS.utilities.data_classes import Trajectory, MovementCommand, PosVec3
+from SWARMRDS.utilities.data_classes import Trajectory, PosVec3
 from SWARMRDS.utilities.log_utils import UserLogger
 
 
+_SQRT2 = math.sqrt(2)
+# Extra cost of a diagonal move over a straight one
+_SQRT2_MINUS_1 = _SQRT2 - 1.0
+
+# The motion model, as a list of [dx, dy, cost] and split into arrays
+# for the search, shared by every planner
+_MOTION_LIST = [[1, 0, 1],
+                [0, 1, 1],
+                [-1, 0, 1],
+                [0, -1, 1],
+                [-1, -1, _SQRT2],
+                [-1, 1, _SQRT2],
+                [1, -1, _SQRT2],
+                [1, 1, _SQRT2]]
+_DX = np.array([1, 0, -1, 0, -1, -1, 1, 1], dtype=np.int64)
+_DY = np.array([0, 1, 0, -1, -1, 1, -1, 1], dtype=np.int64)
+_DCOST = np.array([1.0, 1.0, 1.0, 1.0, _SQRT2, _SQRT2, _SQRT2, _SQRT2])
+
+
+def _octile(dx: int, dy: int) -> float:
+    """
+    The octile distance, which is the exact length of the shortest path
+    between two cells on an open 8-connected grid with diagonal moves
+    costing the square root of 2.
+    """
+    dx = abs(dx)
+    dy = abs(dy)
+    return max(dx, dy) + _SQRT2_MINUS_1 * min(dx, dy)
+
+
+def _walkable(flat_map: bytes, width: int, height: int, x: int, y: int) -> bool:
+    """
+    Whether the cell is within the map and not occupied.
+    """
+    return 0 <= x < width and 0 <= y < height and flat_map[y * width + x] == 0
+
+
+def _jump_straight(flat_map: bytes, width: int, height: int, x: int, y: int, dx: int, dy: int, gx: int, gy: int) -> tuple:
+    """
+    Step from the cell along a horizontal or vertical direction until
+    reaching the goal or a cell with a forced neighbor, which is the
+    next jump point.
+
+    ### Returns:
+    - `tuple` The jump point, or (-1, -1) if an obstacle or the edge of
+              the map was reached first
+    """
+    while True:
+        x += dx
+        y += dy
+        if not _walkable(flat_map, width, height, x, y):
+            return -1, -1
+        if x == gx and y == gy:
+            return x, y
+        if dx != 0:
+            if (_walkable(flat_map, width, height, x + dx, y + 1) and not _walkable(flat_map, width, height, x, y + 1)) or \
+               (_walkable(flat_map, width, height, x + dx, y - 1) and not _walkable(flat_map, width, height, x, y - 1)):
+                return x, y
+        else:
+            if (_walkable(flat_map, width, height, x + 1, y + dy) and not _walkable(flat_map, width, height, x + 1, y)) or \
+               (_walkable(flat_map, width, height, x - 1, y + dy) and not _walkable(flat_map, width, height, x - 1, y)):
+                return x, y
+
+
+def _jump(flat_map: bytes, width: int, height: int, x: int, y: int, dx: int, dy: int, gx: int, gy: int) -> tuple:
+    """
+    Find the next jump point from the cell along the direction. A
+    diagonal step is also a jump point if it has a forced neighbor or
+    if a straight jump along either of its components finds one.
+
+    ### Returns:
+    - `tuple` The jump point, or (-1, -1) if there is none
+    """
+    if dx == 0 or dy == 0:
+        return _jump_straight(flat_map, width, height, x, y, dx, dy, gx, gy)
+
+    while True:
+        x += dx
+        y += dy
+        if not _walkable(flat_map, width, height, x, y):
+            return -1, -1
+        if x == gx and y == gy:
+            return x, y
+        if (_walkable(flat_map, width, height, x - dx, y + dy) and not _walkable(flat_map, width, height, x - dx, y)) or \
+           (_walkable(flat_map, width, height, x + dx, y - dy) and not _walkable(flat_map, width, height, x, y - dy)):
+            return x, y
+        if _jump_straight(flat_map, width, height, x, y, dx, 0, gx, gy)[0] != -1 or \
+           _jump_straight(flat_map, width, height, x, y, 0, dy, gx, gy)[0] != -1:
+            return x, y
+
+
+def _astar_core(flat_map: bytes,
+                width: int,
+                height: int,
+                sx: int,
+                sy: int,
+                gx: int,
+                gy: int,
+                dx: np.ndarray,
+                dy: np.ndarray,
+                dcost: np.ndarray) -> tuple:
+    """
+    The A* search over the cells of the obstacle map. Cells are
+    identified by their index in the flattened map, `y * width + x`.
+
+    Rather than every neighbor of a node, only the jump points reachable
+    from it are added to the open set (Jump Point Search), which returns
+    an equally short path while expanding far fewer nodes on a grid.
+
+    ### Inputs:
+    - `flat_map` (bytes) The flattened occupancy map, non-zero if
+                              occupied
+    - `width`, `height` (int) The size of the occupancy map
+    - `sx`, `sy` (int) The start cell in the map
+    - `gx`, `gy` (int) The goal cell in the map
+    - `dx`, `dy`, `dcost` (np.ndarray) The motion model
+
+    ### Returns:
+    - `parent` (list) The index of the jump point each jump point was
+                      reached from, -1 for the start and unreached cells
+    - `found` (bool) Whether the goal was reached
+    """
+    # Indexing a NumPy array one element at a time is much slower than
+    # indexing lists, so the search works on plain Python containers
+    dx, dy, dcost = dx.tolist(), dy.tolist(), dcost.tolist()
+    g_score = [math.inf] * (width * height)
+    parent = [-1] * (width * height)
+    closed = bytearray(width * height)
+    # The heuristic of each cell, computed the first time it is pushed
+    h_cache = [-1.0] * (width * height)
+    start_id = sy * width + sx
+    goal_id = gy * width + gx
+    g_score[start_id] = 0.0
+
+    # The index into the motion model of each direction, keyed by
+    # (dy + 1) * 3 + dx + 1, and the directions to jump in from a node
+    motion_count = len(dx)
+    motion_index = [-1] * 9
+    for i in range(motion_count):
+        motion_index[(dy[i] + 1) * 3 + dx[i] + 1] = i
+    directions = [0] * motion_count
+
+    # A node may be pushed more than once if a cheaper path to it is
+    # found, so entries that are already closed are skipped when popped.
+    # Ties in the f score are broken towards the node closest to the
+    # goal, which avoids expanding whole plateaus of equal f scores on
+    # open ground, and then in insertion order by the counter.
+    h = _octile(gx - sx, gy - sy)
+    open_heap = [(h, h, 0, start_id)]
+    counter = 1
+    while len(open_heap) > 0:
+        _, _, _, c_id = heapq.heappop(open_heap)
+        if closed[c_id]:
+            continue
+        if c_id == goal_id:
+            return parent, True
+        closed[c_id] = True
+
+        cx = c_id % width
+        cy = c_id // width
+        c_g = g_score[c_id]
+
+        # Jump in every direction from the start. Otherwise only keep
+        # going in the direction of travel, its components if diagonal,
+        # and towards any neighbors forced by an adjacent obstacle.
+        p_id = parent[c_id]
+        if p_id == -1:
+            direction_count = motion_count
+            for i in range(motion_count):
+                directions[i] = i
+        else:
+            ddx = cx - p_id % width
+            ddy = cy - p_id // width
+            ddx = 1 if ddx > 0 else (-1 if ddx < 0 else 0)
+            ddy = 1 if ddy > 0 else (-1 if ddy < 0 else 0)
+            direction_count = 0
+            candidates = [(ddx, ddy)]
+            if ddx != 0 and ddy != 0:
+                candidates.append((ddx, 0))
+                candidates.append((0, ddy))
+                if not _walkable(flat_map, width, height, cx - ddx, cy):
+                    candidates.append((-ddx, ddy))
+                if not _walkable(flat_map, width, height, cx, cy - ddy):
+                    candidates.append((ddx, -ddy))
+            elif ddx != 0:
+                if not _walkable(flat_map, width, height, cx, cy + 1):
+                    candidates.append((ddx, 1))
+                if not _walkable(flat_map, width, height, cx, cy - 1):
+                    candidates.append((ddx, -1))
+            else:
+                if not _walkable(flat_map, width, height, cx + 1, cy):
+                    candidates.append((1, ddy))
+                if not _walkable(flat_map, width, height, cx - 1, cy):
+                    candidates.append((-1, ddy))
+            for candidate_dx, candidate_dy in candidates:
+                i = motion_index[(candidate_dy + 1) * 3 + candidate_dx + 1]
+                if i != -1:
+                    directions[direction_count] = i
+                    direction_count += 1
+
+        for k in range(direction_count):
+            i = directions[k]
+            nx, ny = _jump(flat_map, width, height, cx, cy, dx[i], dy[i], gx, gy)
+            if nx == -1:
+                continue
+            n_id = ny * width + nx
+            if closed[n_id]:
+                continue
+            g = c_g + max(abs(nx - cx), abs(ny - cy)) * dcost[i]
+            if g < g_score[n_id]:
+                # Either a new node was discovered or this path is the
+                # best until now, so record it
+                g_score[n_id] = g
+                parent[n_id] = c_id
+                h = h_cache[n_id]
+                if h < 0.0:
+                    h = _octile(gx - nx, gy - ny)
+                    h_cache[n_id] = h
+                heapq.heappush(open_heap, (g + h, h, counter, n_id))
+                counter += 1
+
+    return parent, False
+
+
+def _reconstruct_path(parent: list, goal_id: int, width: int) -> np.ndarray:
+    """
+    Follow the parent indices from the goal back to the start, filling
+    in the cells on the straight line between each pair of jump points.
+    The cells are written into a preallocated array from the back so
+    the path runs start to goal.
+
+    ### Inputs:
+    - `parent` (list) The parent indices returned by `_astar_core`
+    - `goal_id` (int) The index of the goal cell
+    - `width` (int) The width of the obstacle map
+
+    ### Returns:
+    - `np.ndarray` The indices of the cells from the start to the goal
+    """
+    length = 1
+    cell = goal_id
+    while parent[cell] != -1:
+        previous = parent[cell]
+        length += max(abs(cell % width - previous % width), abs(cell // width - previous // width))
+        cell = previous
+
+    cells = np.empty(length, dtype=np.int64)
+    i = length - 1
+    cells[i] = goal_id
+    cell = goal_id
+    while parent[cell] != -1:
+        previous = parent[cell]
+        x, y = cell % width, cell // width
+        px, py = previous % width, previous // width
+        step_x = 1 if px > x else (-1 if px < x else 0)
+        step_y = 1 if py > y else (-1 if py < y else 0)
+        while x != px or y != py:
+            x += step_x
+            y += step_y
+            i -= 1
+            cells[i] = y * width + x
+        cell = previous
+
+    return cells
+
+
 class AStar(Algorithm):
     """
     A planner that simply passes through the given commands to the
@@ -54,7 +317,16 @@ class AStar(Algorithm):
         self.min_x, self.min_y = -map_size[0], -map_size[1]
         self.max_x, self.max_y = map_size[0], map_size[1]
         self.x_width, self.y_width = map_size[0] * 2, map_size[1] * 2
+        # The occupancy map flattened into bytes of 0 or 1 per cell, which
+        # are faster to index one at a time than an array, converted each
+        # time a trajectory is planned
+        self.flat_map = None
+        self.map_width, self.map_height = 0, 0
+        # Offset of the grid indices into the obstacle map
+        self.ox = int(map_size[0]) + int(starting_point[0])
+        self.oy = int(map_size[1]) + int(starting_point[1])
         self.motion = self.get_motion_model()
+        self.DX, self.DY, self.DCOST = _DX, _DY, _DCOST
         self.flight_altitude = flight_altitude
         self.executing_trajectory = False
 
@@ -79,33 +351,36 @@ class AStar(Algorithm):
         # values. Plenty of flexibility here as you could stipulate
         # that one of the inputs be the next goal point that is 
         # determined by another algorithm.
-        for key, item in kwargs.items():
-            if key == "OccupancyMap":
-                self.obstacle_map = item
-                break
+        self.obstacle_map = kwargs.get("OccupancyMap")
 
-        if type(self.obstacle_map).__name__ == "NoneType":
+        if self.obstacle_map is None:
             return None
 
         if not self.executing_trajectory:
+            # Flatten the map we are about to plan over. The map may have
+            # been updated in place, so this is redone for every plan.
+            self.map_height, self.map_width = self.obstacle_map.shape[:2]
+            self.flat_map = np.ascontiguousarray(self.obstacle_map != 0).view(np.uint8).tobytes()
             # Plan for the trajectory
             # We start at X=0 and Y=0 in NED coordiantes, but that is map_size[0], map_size[1] in the map
             # We also must make sure that we offset our goal point as well
             self.log.log_message("Requesting a Trajectory from the planner")
-            trajectory = self.planning(self.position.X + int(self.map_size[0]) + int(self.starting_position[0]),
-                                       self.position.Y + int(self.map_size[1]) + int(self.starting_position[1]),
-                                       self.goal_point.X + int(self.map_size[0]) + int(self.starting_position[0]),
-                                       self.goal_point.Y + int(self.map_size[1]) + int(self.starting_position[1]))
+            ox, oy = self.ox, self.oy
+            trajectory = self.planning(self.position.X + ox,
+                                       self.position.Y + oy,
+                                       self.goal_point.X + ox,
+                                       self.goal_point.Y + oy)
             self.log.log_message("Trajectory found!")
             self.log.log_message(trajectory.displayPretty())
             self.executing_trajectory = True
             return trajectory
         else:
-            time.sleep(0.1)
             # SWARM will ignore these values
             return None
 
     class Node:
+        __slots__ = ("x", "y", "cost", "parent_index")
+
         def __init__(self, x, y, cost, parent_index):
             self.x = x  # index of grid
             self.y = y  # index of grid
@@ -129,111 +404,57 @@ class AStar(Algorithm):
             ry: y position list of the final path
         """
 
-        start_node = self.Node(self.calc_xy_index(sx, self.min_x),
-                               self.calc_xy_index(sy, self.min_y), 0.0, -1)
-        goal_node = self.Node(self.calc_xy_index(gx, self.min_x),
-                              self.calc_xy_index(gy, self.min_y), 0.0, -1)
-
-        open_set, closed_set = dict(), dict()
-        print("Grid index is {}".format(self.calc_grid_index(start_node)))
-        open_set[self.calc_grid_index(start_node)] = start_node
-        iteration = 0
-        while True:
-            iteration += 1
-            if len(open_set) == 0:
-                print("Open set is empty..")
-                break
-            # print(f"Iteration {iteration}")
-            c_id = min(
-                open_set,
-                key=lambda o: open_set[o].cost + self.calc_heuristic(goal_node,
-                                                                     open_set[
-                                                                         o]))
-            current = open_set[c_id]
-
-            if current.x == goal_node.x and current.y == goal_node.y:
-                self.log.log_message("Found goal!")
-                goal_node.parent_index = current.parent_index
-                goal_node.cost = current.cost
-                break
-
-            # Remove the item from the open set
-            del open_set[c_id]
-
-            # Add it to the closed set
-            closed_set[c_id] = current
-
-            # expand_grid search grid based on motion model
-            for i, _ in enumerate(self.motion):
-                node = self.Node(current.x + self.motion[i][0],
-                                 current.y + self.motion[i][1],
-                                 current.cost + self.motion[i][2], c_id)
-                n_id = self.calc_grid_index(node)
-                # If the node is not safe, do nothing
-                if not self.verify_node(node):
-                    continue
-
-                if n_id in closed_set:
-                    continue
-
-                if n_id not in open_set:
-                    open_set[n_id] = node  # discovered a new node
-                else:
-                    if open_set[n_id].cost > node.cost:
-                        # This path is the best until now. record it
-                        open_set[n_id] = node
-
-        trajectory = self.calc_final_path(goal_node, closed_set)
+        # Grid index of the start and goal. The minimum positions are
+        # always non-positive, as they are the negative map size in NED
+        resolution, min_x, min_y = self.resolution, self.min_x, self.min_y
+        start_x, start_y = round((sx + min_x) / resolution), round((sy + min_y) / resolution)
+        goal_x, goal_y = round((gx + min_x) / resolution), round((gy + min_y) / resolution)
+
+        # The search runs over the cells of the obstacle map, so offset
+        # the grid indices into the map
+        ox, oy = self.ox, self.oy
+        width, height = self.map_width, self.map_height
+        msx, msy = start_x + ox, start_y + oy
+        mgx, mgy = goal_x + ox, goal_y + oy
+        if 0 <= msx < width and 0 <= msy < height and 0 <= mgx < width and 0 <= mgy < height:
+            parent, found = _astar_core(self.flat_map, width, height, msx, msy, mgx, mgy, self.DX, self.DY, self.DCOST)
+        else:
+            parent, found = None, False
+
+        if found:
+            self.log.log_message("Found goal!")
+        else:
+            self.log.log_message("Open set is empty..")
+
+        trajectory = self.calc_final_path(goal_x, goal_y, parent if found else None, width, ox, oy)
 
         return trajectory
 
-    def calc_final_path(self, goal_node, closed_set):
-        # generate final course
-        trajectory = Trajectory()
-        position = PosVec3()
-        position.X = self.calc_grid_position(goal_node.x, self.min_x)
-        position.Y = self.calc_grid_position(goal_node.y, self.min_y)
-        position.Z = self.flight_altitude
-        
-        command = MovementCommand(position=position, speed=self.agent_speed)
-        trajectory.points.append(command)
-        parent_index = goal_node.parent_index
-        
-        traj_point_index = 0
-        while parent_index != -1:
-            position = PosVec3()
-            n = closed_set[parent_index]
-            position.X = self.calc_grid_position(n.x, self.min_x)
-            position.Y = self.calc_grid_position(n.y, self.min_y)
-            position.Z = self.flight_altitude
-            command = MovementCommand(position=position, speed=self.agent_speed)
-            trajectory.points.append(command)
-            traj_point_index += 1
-            parent_index = n.parent_index
-
-        # We go from goal to start, so reverse this so we fly start to
-        # goal
-        trajectory.points.reverse()
-
-        # # Downsample the points by 2
-        # new_points = list()
-        for i, point in enumerate(trajectory.points):
-            if i == 0:
-                heading = np.degrees(np.arctan2(point.position.Y - self.position.Y, point.position.X - self.position.X))
-            else:
-                heading = np.degrees(np.arctan2(point.position.Y - trajectory.points[i - 1].position.Y, point.position.X -  trajectory.points[i - 1].position.X))
-            
-            trajectory.points[i].heading = heading
-            # print(heading, trajectory.points[i].heading)
+    def calc_final_path(self, goal_x, goal_y, parent, width, ox, oy):
+        # generate final course, from start to goal if the goal was
+        # reached, otherwise straight to the goal
+        if parent is not None:
+            cells = _reconstruct_path(parent, (goal_y + oy) * width + goal_x + ox, width)
+            grid_xs = cells % width - ox
+            grid_ys = cells // width - oy
+        else:
+            grid_xs = np.array([goal_x])
+            grid_ys = np.array([goal_y])
+        # See calc_grid_position
+        resolution, map_offset = self.resolution, self.map_size[0]
+        xs = grid_xs * resolution + self.min_x + map_offset
+        ys = grid_ys * resolution + self.min_y + map_offset
 
-        # trajectory.points = new_points
+        # Head each point along the direction of travel from the previous
+        # point, starting from the current position of the agent
+        headings = np.degrees(np.arctan2(np.diff(ys, prepend=self.position.Y), np.diff(xs, prepend=self.position.X)))
 
-        return trajectory
+        return Trajectory.from_arrays(xs, ys, self.flight_altitude, self.agent_speed, headings)
 
     @staticmethod
     def calc_heuristic(n1, n2):
         w = 1.0  # weight of heuristic
-        d = w * math.hypot(n1.x - n2.x, n1.y - n2.y)
+        d = w * _octile(n1.x - n2.x, n1.y - n2.y)
         return d
 
     def calc_grid_position(self, index, min_position):
@@ -246,33 +467,21 @@ class AStar(Algorithm):
         pos = index * self.resolution + min_position + self.map_size[0]
         return pos
 
-    def calc_xy_index(self, position: tuple, min_pos):
-        if min_pos > 0:
-            return round((position - min_pos) / self.resolution)
-        else:
-            return round((position + min_pos) / self.resolution)
-
     def calc_grid_index(self, node: Node):
         return (node.y - self.min_y) * self.y_width + (node.x - self.min_x)
 
     def verify_node(self, node: Node):
-        px = self.calc_grid_position(node.x, self.min_x)
-        py = self.calc_grid_position(node.y, self.min_y)
-        # print(px, py)
-        if px < self.min_x:
-            return False
-        elif py < self.min_y:
-            return False
-        elif px >= self.max_x:
-            return False
-        elif py >= self.max_y:
+        # The map is row major so the Y axis is the outer index and we
+        # still need to be sure to offset the points when we check the map.
+        # The bounds are checked on the offset indices, as those index the
+        # map.
+        mx = node.x + self.ox
+        my = node.y + self.oy
+        if mx < 0 or my < 0 or mx >= self.map_width or my >= self.map_height:
             return False
 
         # collision check
-        # Numpy is row major so first index is the Y axis and we still need
-        # to be sure to offset the points when we check the map
-        if self.obstacle_map[node.y + int(self.map_size[1]) + int(self.starting_position[1])][node.x + int(self.map_size[0]) + int(self.starting_position[0])]:
-            print("Collided")
+        if self.flat_map[my * self.map_width + mx]:
             return False
 
         return True
@@ -280,16 +489,7 @@ class AStar(Algorithm):
     @staticmethod
     def get_motion_model():
         # dx, dy, cost
-        motion = [[1, 0, 1],
-                  [0, 1, 1],
-                  [-1, 0, 1],
-                  [0, -1, 1],
-                  [-1, -1, math.sqrt(2)],
-                  [-1, 1, math.sqrt(2)],
-                  [1, -1, math.sqrt(2)],
-                  [1, 1, math.sqrt(2)]]
-
-        return motion
+        return _MOTION_LIST
 
 
 def plot_trajectory(x_points: list, y_points: list, off_set_x: float, off_set_y: float):
@@ -297,6 +497,9 @@ def plot_trajectory(x_points: list, y_points: list, off_set_x: float, off_set_y:
     Plot the calculated trajectory, scaling the points as the saved
     png image is not exactly to scale with the coordinates
     """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+
     img = plt.imread("maps/occupancy_map.png")
     plt.imshow(img)
     fig = plt.gcf()
@@ -318,6 +521,8 @@ def plot_trajectory(x_points: list, y_points: list, off_set_x: float, off_set_y:
     plt.show()
 
 if __name__ == "__main__":
+    import pickle
+
     log = logging.Logger(__name__)
     logger = UserLogger(log, "Drone1")
     planner = AStar([50.0, 30.0], [100.0, 100.0])